@@ -0,0 +1,10 @@
+# array_utils.py
+
+import numpy as np
+
+def expand_ranges(starts, ends):
+    """Return (owner, position) for every position in the half-open ranges [starts, ends)."""
+    lengths = np.maximum(ends - starts, 0)
+    owners = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return owners, starts[owners] + offsets
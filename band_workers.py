@@ -0,0 +1,186 @@
+# band_workers.py
+
+import time
+import traceback
+import multiprocessing
+import numpy as np
+from constants import BAND_WORKERS, GHOST_ZONE_HEIGHT, WINDOW_HEIGHT
+from unit_data import SharedUnitData
+from unit_manager import UnitManager
+
+def band_boundaries(num_bands, height=WINDOW_HEIGHT):
+    """Equal-height band edges along y; the outer edges are open so off-field units stay owned."""
+    boundaries = np.linspace(0, height, num_bands + 1)
+    boundaries[0], boundaries[-1] = -np.inf, np.inf
+    return boundaries
+
+def assign_bands(boundaries, ys):
+    """Return the band containing each y coordinate."""
+    bands = np.searchsorted(boundaries, ys, side='right') - 1
+    return np.clip(bands, 0, len(boundaries) - 2).astype(np.int8)
+
+def ghost_zone_height(vision_ranges):
+    """How far past its edges a region must read so its units see every unit they can interact with.
+
+    That is the largest vision range, since pursuit looks that far, but
+    never less than GHOST_ZONE_HEIGHT.
+    """
+    return max(float(np.max(vision_ranges, initial=0)), GHOST_ZONE_HEIGHT)
+
+def step_band(band, manager, boundaries, dt, ghost_height=None):
+    """Advance the units owned by `band`, reading ghosts from the neighboring bands.
+
+    `ghost_height` defaults to the ghost zone needed by the live units.
+    Results go to the double-buffered `next_*` columns so neighbors keep
+    reading this tick's positions while the band writes the next ones.
+    Returns the number of owned units and how many of them migrated.
+    """
+    unit_data = manager.unit_data
+    active_indices = np.nonzero(unit_data.active)[0]
+    ys = unit_data.position[active_indices, 1]
+    if ghost_height is None:
+        ghost_height = ghost_zone_height(unit_data.vision_range[active_indices])
+    top, bottom = boundaries[band], boundaries[band + 1]
+    owned_mask = unit_data.band[active_indices] == band
+    ghost_mask = (ys >= top - ghost_height) & (ys < bottom + ghost_height)
+    local_indices = active_indices[owned_mask | ghost_mask]
+    owned = np.nonzero(unit_data.band[local_indices] == band)[0]
+    if len(owned) == 0:
+        return 0, 0
+    owned_indices = local_indices[owned]
+
+    # A ghost zone at least one cell tall holds every unit sharing a cell with an owned unit
+    positions = unit_data.position[local_indices]
+    manager.cell_aggregates.rebuild(positions, unit_data.velocity[local_indices])
+    alignment, cohesion_center = manager.cell_aggregates.lookup(positions)
+    units = manager.gather_units(local_indices, alignment, cohesion_center)
+    manager.update_neighbor_pairs(local_indices, units['position'], units['team'])
+    manager.add_neighbor_forces(units, owned)
+    forces, targets = manager.force_executor.compute_forces(units, dt, owned)
+    positions, velocities = manager.integrate(
+        units['position'][owned], units['velocity'][owned], units['team'][owned],
+        units['max_speed'][owned], forces, dt
+    )
+
+    unit_data.next_position[owned_indices] = positions
+    unit_data.next_velocity[owned_indices] = velocities
+    unit_data.target[owned_indices] = targets
+
+    # Units that crossed a band edge migrate to the band now containing them
+    new_bands = assign_bands(boundaries, positions[:, 1])
+    unit_data.next_band[owned_indices] = new_bands
+    return len(owned), int(np.count_nonzero(new_bands != band))
+
+def run_band_worker(band, layout, connection):
+    """Worker process loop: map the shared columns once, then step the band on request."""
+    unit_data = SharedUnitData.attach(layout)
+    manager = UnitManager(unit_data, force_workers=1)
+    try:
+        while True:
+            message = connection.recv()
+            if message[0] == 'stop':
+                break
+            _, dt, boundaries = message
+            start = time.perf_counter()
+            try:
+                owned, migrated = step_band(band, manager, np.asarray(boundaries), dt)
+            except Exception:
+                connection.send(('error', traceback.format_exc()))
+                continue
+            connection.send(('done', owned, migrated, time.perf_counter() - start))
+    finally:
+        unit_data.close(unlink=False)
+        connection.close()
+
+class BandProcessPool:
+    """Runs unit updates in worker processes that each own a horizontal band of the field.
+
+    Workers map the SharedUnitData columns directly, so a step only sends the
+    time delta and band edges over each pipe; no unit data is pickled.
+    """
+
+    def __init__(self, unit_data, num_bands=BAND_WORKERS, balancer=None):
+        self.unit_data = unit_data
+        self.num_bands = num_bands
+        self.boundaries = band_boundaries(num_bands)
+        self.balancer = balancer
+
+        # Shared scratch columns written by the workers and committed after each step
+        unit_data.next_position = unit_data.allocate('next_position', (2,), np.float32)
+        unit_data.next_velocity = unit_data.allocate('next_velocity', (2,), np.float32)
+        unit_data.next_band = unit_data.allocate('next_band', (), np.int8)
+
+        # Per-band statistics from the last step
+        self.owned_counts = np.zeros(num_bands, dtype=np.int64)
+        self.step_times = np.zeros(num_bands)
+        self.migrations = 0
+
+        self.connections = []
+        self.processes = []
+        for band in range(num_bands):
+            parent_end, child_end = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=run_band_worker, args=(band, unit_data.layout, child_end), daemon=True
+            )
+            process.start()
+            child_end.close()
+            self.connections.append(parent_end)
+            self.processes.append(process)
+
+    def rebalance(self, unit_positions, bullet_positions):
+        """Periodically move the band edges so every worker carries a similar load.
+
+        Every live unit is handed to the band that now contains it; this runs
+        between steps, while no worker touches the band column.
+        """
+        if self.balancer is None or not self.balancer.due():
+            return
+        self.balancer.observe(unit_positions, bullet_positions)
+        self.balancer.record_region_times(self.step_times)
+        self.boundaries = self.balancer.split_bands(self.num_bands, WINDOW_HEIGHT)
+        active_indices = np.nonzero(self.unit_data.active)[0]
+        self.unit_data.band[active_indices] = assign_bands(
+            self.boundaries, self.unit_data.position[active_indices, 1]
+        )
+
+    def step(self, dt):
+        """Step every band in parallel."""
+        unit_data = self.unit_data
+        active_indices = np.nonzero(unit_data.active)[0]
+
+        # Units spawned since the last step join the band containing them
+        unassigned = active_indices[unit_data.band[active_indices] < 0]
+        unit_data.band[unassigned] = assign_bands(self.boundaries, unit_data.position[unassigned, 1])
+
+        boundaries = tuple(self.boundaries)
+        for connection in self.connections:
+            connection.send(('step', dt, boundaries))
+        errors = []
+        for band, connection in enumerate(self.connections):
+            reply = connection.recv()
+            if reply[0] == 'error':
+                errors.append(f"Band {band} worker failed:\n{reply[1]}")
+                continue
+            _, self.owned_counts[band], migrated, self.step_times[band] = reply
+            self.migrations += migrated
+        if errors:
+            raise RuntimeError("\n".join(errors))
+
+        # Commit the double-buffered results
+        unit_data.position[active_indices] = unit_data.next_position[active_indices]
+        unit_data.velocity[active_indices] = unit_data.next_velocity[active_indices]
+        unit_data.band[active_indices] = unit_data.next_band[active_indices]
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        for connection in self.connections:
+            try:
+                connection.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+        for connection in self.connections:
+            connection.close()
+        self.connections = []
+        self.processes = []
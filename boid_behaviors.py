@@ -1,17 +1,26 @@
 # boid_behaviors.py
 
 import numpy as np
-from constants import DESTINATION1, DESTINATION2, MAX_SPEED
-import numpy as np
-
-def compute_separation_forces(positions, teams, SEPARATION_DISTANCE, SEPARATION_WEIGHT):
-    """Compute separation forces using vectorized operations."""
-    diff = positions[:, np.newaxis, :] - positions[np.newaxis, :, :]
+from constants import (
+    DESTINATION1, DESTINATION2, MAX_SPEED, SEPARATION_DISTANCE, SEPARATION_WEIGHT,
+    ALIGNMENT_WEIGHT, COHESION_WEIGHT, PURSUIT_WEIGHT, KERNEL_BLOCK_SIZE
+)
+
+def compute_separation_forces(positions, SEPARATION_DISTANCE, SEPARATION_WEIGHT, neighbor_positions=None):
+    """Compute separation forces using vectorized operations.
+
+    Units only keep apart from allies, so all units and neighbors must share a
+    team. Neighbors default to the units themselves; pass neighbor positions
+    to push a block of units away from a larger candidate set.
+    """
+    if neighbor_positions is None:
+        neighbor_positions = positions
+    diff = positions[:, np.newaxis, :] - neighbor_positions[np.newaxis, :, :]
     distances = np.linalg.norm(diff, axis=2)
-    separation_mask = (distances > 0) & (distances < SEPARATION_DISTANCE) & \
-                      (teams[:, np.newaxis] == teams[np.newaxis, :])
+    separation_mask = (distances > 0) & (distances < SEPARATION_DISTANCE)
     with np.errstate(divide='ignore', invalid='ignore'):
-        normalized_diff = np.divide(diff, distances[:, :, np.newaxis], where=distances[:, :, np.newaxis] != 0)
+        normalized_diff = np.divide(diff, distances[:, :, np.newaxis], out=np.zeros_like(diff),
+                                    where=distances[:, :, np.newaxis] != 0)
         normalized_diff[~np.isfinite(normalized_diff)] = 0
     separation_vectors = np.sum(normalized_diff * separation_mask[:, :, np.newaxis], axis=1)
     return separation_vectors * SEPARATION_WEIGHT
@@ -24,77 +33,175 @@ def compute_alignment_and_cohesion(positions, velocities, boid_data,
     desired = cohesion_center - positions
     distances_to_cohesion = np.linalg.norm(desired, axis=1, keepdims=True)
     with np.errstate(divide='ignore', invalid='ignore'):
-        desired = np.divide(desired, distances_to_cohesion, where=distances_to_cohesion != 0)
+        desired = np.divide(desired, distances_to_cohesion, out=np.zeros_like(desired), where=distances_to_cohesion != 0)
         desired[~np.isfinite(desired)] = 0
     cohesion = desired * max_speeds[:, np.newaxis] - velocities
     return alignment * ALIGNMENT_WEIGHT, cohesion * COHESION_WEIGHT
 
-def compute_pursuit_forces(cell_indices_in_active, active_indices, positions, velocities, teams,
-                           cell_positions, cell_teams, cell_velocities, cell_max_speeds,
-                           cell_cooldowns, cell_attack_speeds, cell_is_ranged, cell_damage,
-                           cell_vision_ranges, cell_attack_ranges, PURSUIT_WEIGHT, dt):
-    """Compute pursuit forces and handle attack logic."""
-    # Initialize arrays
+def compute_separation_forces_from_pairs(positions, pairs_i, pairs_j,
+                                         SEPARATION_DISTANCE, SEPARATION_WEIGHT):
+    """Compute separation forces from an ally pair list, each pair pushing both units apart."""
+    diff = positions[pairs_i] - positions[pairs_j]
+    distances = np.linalg.norm(diff, axis=1)
+    separation_mask = (distances > 0) & (distances < SEPARATION_DISTANCE)
+    normalized_diff = np.divide(diff, distances[:, np.newaxis], out=np.zeros_like(diff),
+                                where=separation_mask[:, np.newaxis])
+    separation_vectors = np.zeros(positions.shape, dtype=np.float64)
+    for axis in range(2):
+        separation_vectors[:, axis] = (
+            np.bincount(pairs_i, weights=normalized_diff[:, axis], minlength=len(positions)) -
+            np.bincount(pairs_j, weights=normalized_diff[:, axis], minlength=len(positions))
+        )
+    return (separation_vectors * SEPARATION_WEIGHT).astype(np.float32)
+
+def compute_cohesion_from_pairs(positions, velocities, pairs_i, pairs_j,
+                                cohesion_radius, COHESION_WEIGHT, max_speeds):
+    """Compute cohesion towards the center of each unit and its neighbors within `cohesion_radius`.
+
+    The pairs must join allies only.
+    """
+    diff = positions[pairs_j] - positions[pairs_i]
+    close = np.einsum('ij,ij->i', diff, diff) < cohesion_radius * cohesion_radius
+    pairs_i, pairs_j = pairs_i[close], pairs_j[close]
+    counts = 1 + np.bincount(pairs_i, minlength=len(positions)) + np.bincount(pairs_j, minlength=len(positions))
+    position_sums = positions.astype(np.float64)
+    for axis in range(2):
+        position_sums[:, axis] += (
+            np.bincount(pairs_i, weights=positions[pairs_j, axis], minlength=len(positions)) +
+            np.bincount(pairs_j, weights=positions[pairs_i, axis], minlength=len(positions))
+        )
+    boid_data = {'cohesion_center': position_sums / counts[:, np.newaxis]}
+    _, cohesion = compute_alignment_and_cohesion(
+        positions, velocities, boid_data, 0.0, COHESION_WEIGHT, max_speeds
+    )
+    return cohesion.astype(np.float32)
+
+def sort_slots(enemy_slots):
+    """Return the order that sorts the enemy slots and the sorted slots, for `find_targets`."""
+    order = np.argsort(enemy_slots, kind='stable')
+    return order, enemy_slots[order]
+
+def find_targets(slot_index, cell_targets):
+    """Return the row of each unit's stored target among the enemies, or -1 if it is not there.
+
+    `slot_index` is the `sort_slots` result for the enemy slots.
+    """
+    order, sorted_slots = slot_index
+    found_at = np.minimum(np.searchsorted(sorted_slots, cell_targets), max(len(sorted_slots) - 1, 0))
+    found = (cell_targets >= 0) & (len(sorted_slots) > 0)
+    found[found] = sorted_slots[found_at[found]] == cell_targets[found]
+    return np.where(found, order[found_at] if len(order) else -1, -1)
+
+def compute_pursuit_forces(enemy_positions, enemy_slots, cell_positions, cell_velocities, cell_max_speeds,
+                           cell_vision_ranges, cell_targets, cell_retarget, PURSUIT_WEIGHT, slot_index=None):
+    """Compute pursuit forces towards each unit's target.
+
+    All units in `cell_positions` share a team and `enemy_positions` holds
+    only units of the other teams, whose unit slots are `enemy_slots`. A unit
+    keeps chasing its stored target while that target is still among the
+    enemies and in vision; the nearest enemy is only searched for when the
+    target is lost or the unit's `cell_retarget` flag is set. Also returns
+    every unit's target slot after this step (-1 for none), which the combat
+    stage attacks. Pass `slot_index` from `sort_slots` when several blocks
+    pursue the same enemies, so the slots are sorted once.
+    """
     pursuit_forces = np.zeros_like(cell_positions)
-    fire_bullet_mask = np.zeros(len(cell_positions), dtype=bool)
-    fire_target_positions = np.zeros((len(cell_positions), 2), dtype=np.float32)
-    updated_cooldowns = cell_cooldowns.copy()
-
-    # Identify enemy units
-    enemy_mask = teams[:, np.newaxis] != cell_teams[np.newaxis, :]
-    enemy_positions = positions[enemy_mask.any(axis=1)]
-    enemy_teams = teams[enemy_mask.any(axis=1)]
+    updated_targets = np.full(len(cell_positions), -1, dtype=np.int32)
 
     if len(enemy_positions) == 0:
-        return pursuit_forces, fire_bullet_mask, fire_target_positions, updated_cooldowns
-
-    # Compute differences and distances to enemies
-    diff = enemy_positions[np.newaxis, :, :] - cell_positions[:, np.newaxis, :]
-    distances = np.linalg.norm(diff, axis=2)
-
-    # Determine enemies within vision range
-    within_vision = distances <= cell_vision_ranges[:, np.newaxis]
-    has_enemy_in_vision = np.any(within_vision, axis=1)
-    if not np.any(has_enemy_in_vision):
-        return pursuit_forces, fire_bullet_mask, fire_target_positions, updated_cooldowns
-
-    indices_in_cell = np.arange(len(cell_positions))[has_enemy_in_vision]
-
-    # For units with enemies in vision, find the closest enemy
-    enemy_distances = distances[has_enemy_in_vision]
-    enemy_diffs = diff[has_enemy_in_vision]
-    # Mask distances beyond vision range
-    enemy_distances[~within_vision[has_enemy_in_vision]] = np.inf
-
-    # Find the closest enemy for each unit
-    closest_enemy_indices = np.argmin(enemy_distances, axis=1)
-    closest_enemy_positions = enemy_positions[closest_enemy_indices]
-    closest_enemy_diffs = enemy_diffs[np.arange(len(enemy_diffs)), closest_enemy_indices]
+        return pursuit_forces, updated_targets
+
+    # Cheap check of the stored targets
+    if slot_index is None:
+        slot_index = sort_slots(enemy_slots)
+    target_rows = find_targets(slot_index, cell_targets)
+    tracked = target_rows >= 0
+    tracked[tracked] = (np.linalg.norm(enemy_positions[target_rows[tracked]] - cell_positions[tracked], axis=1)
+                        <= cell_vision_ranges[tracked])
+    target_rows[~tracked] = -1
+
+    # Full nearest-enemy search only for units that lost their target or are due to look again
+    searching = np.nonzero(~tracked | cell_retarget)[0]
+    if len(searching):
+        diff = enemy_positions[np.newaxis, :, :] - cell_positions[searching, np.newaxis, :]
+        distances = np.linalg.norm(diff, axis=2)
+        distances[distances > cell_vision_ranges[searching, np.newaxis]] = np.inf
+        closest = np.argmin(distances, axis=1)
+        in_vision = np.isfinite(distances[np.arange(len(searching)), closest])
+        target_rows[searching] = np.where(in_vision, closest, -1)
+
+    indices_in_cell = np.nonzero(target_rows >= 0)[0]
+    if len(indices_in_cell) == 0:
+        return pursuit_forces, updated_targets
+    updated_targets[indices_in_cell] = enemy_slots[target_rows[indices_in_cell]]
 
     # Compute pursuit forces
-    desired = closest_enemy_positions - cell_positions[indices_in_cell]
+    desired = enemy_positions[target_rows[indices_in_cell]] - cell_positions[indices_in_cell]
     distances_to_enemy = np.linalg.norm(desired, axis=1, keepdims=True)
     with np.errstate(divide='ignore', invalid='ignore'):
-        desired = np.divide(desired, distances_to_enemy, where=distances_to_enemy != 0)
+        desired = np.divide(desired, distances_to_enemy, out=np.zeros_like(desired), where=distances_to_enemy != 0)
         desired[~np.isfinite(desired)] = 0
     pursuit_vectors = desired * cell_max_speeds[indices_in_cell][:, np.newaxis] - cell_velocities[indices_in_cell]
     pursuit_forces[indices_in_cell] += pursuit_vectors * PURSUIT_WEIGHT
-
-    # Attack logic
-    attackable = distances_to_enemy.squeeze() <= cell_attack_ranges[indices_in_cell]
-    ready_to_attack = (cell_cooldowns[indices_in_cell] <= 0) & attackable
-
-    # Handle ranged units firing bullets
-    ranged_units = cell_is_ranged[indices_in_cell] & ready_to_attack
-    if np.any(ranged_units):
-        ranged_indices = indices_in_cell[ranged_units]
-        fire_bullet_mask[ranged_indices] = True
-        fire_target_positions[ranged_indices] = closest_enemy_positions[ranged_units]
-
-        # Reset cooldowns
-        updated_cooldowns[ranged_indices] = 1 / cell_attack_speeds[ranged_indices]
-
-        # Ranged units stop moving when attacking
-        cell_velocities[ranged_indices] = 0
-
-    return pursuit_forces, fire_bullet_mask, fire_target_positions, updated_cooldowns
+    return pursuit_forces, updated_targets
+
+def compute_region_forces(owned, candidates, units, dt, block_size=KERNEL_BLOCK_SIZE):
+    """Compute separation, alignment, cohesion and pursuit for the owned units of a region.
+
+    `owned` and `candidates` index into the per-unit arrays in `units`; candidates
+    must include every unit the owned units can interact with (the region plus
+    its halo). Candidates are split by team once, so every kernel reads only
+    allies or only enemies, and each team's enemy slots are sorted once for
+    all blocks. Owned units are processed in blocks so the pairwise
+    temporaries stay small. The work is many NumPy calls on small arrays that
+    hold the GIL for much of their time, so tiles run on threads do not
+    scale with cores.
+    """
+    forces = np.zeros((len(owned), 2), dtype=np.float32)
+    targets = units['target'][owned]
+    if len(owned) == 0:
+        return forces, targets
+
+    candidate_positions = units['position'][candidates]
+    candidate_teams = units['team'][candidates]
+    owned_teams = units['team'][owned]
+    ally_positions, enemy_positions, enemy_slots, slot_indices = {}, {}, {}, {}
+    for team in np.unique(owned_teams):
+        ally_positions[team] = candidate_positions[candidate_teams == team]
+        enemy_positions[team] = candidate_positions[candidate_teams != team]
+        enemy_slots[team] = units['index'][candidates[candidate_teams != team]]
+        slot_indices[team] = sort_slots(enemy_slots[team])
+
+    for start in range(0, len(owned), block_size):
+        block_teams = owned_teams[start:start + block_size]
+        for team in np.unique(block_teams):
+            block = start + np.nonzero(block_teams == team)[0]
+            rows = owned[block]
+            positions = units['position'][rows]
+            velocities = units['velocity'][rows]
+            max_speeds = units['max_speed'][rows]
+
+            if 'neighbor_forces' in units:
+                # Separation and cohesion were already summed over cached neighbor pairs
+                separation = units['neighbor_forces'][rows]
+                alignment = (units['alignment'][rows] - velocities) * ALIGNMENT_WEIGHT
+                cohesion = 0
+            else:
+                separation = compute_separation_forces(
+                    positions, SEPARATION_DISTANCE, SEPARATION_WEIGHT, ally_positions[team]
+                )
+                boid_data = {
+                    'alignment': units['alignment'][rows],
+                    'cohesion_center': units['cohesion_center'][rows]
+                }
+                alignment, cohesion = compute_alignment_and_cohesion(
+                    positions, velocities, boid_data, ALIGNMENT_WEIGHT, COHESION_WEIGHT, max_speeds
+                )
+            pursuit, targets[block] = compute_pursuit_forces(
+                enemy_positions[team], enemy_slots[team], positions, velocities, max_speeds,
+                units['vision_range'][rows], targets[block], units['retarget'][rows], PURSUIT_WEIGHT,
+                slot_indices[team]
+            )
+            forces[block] = separation + alignment + cohesion + pursuit
+
+    return forces, targets
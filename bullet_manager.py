@@ -2,40 +2,229 @@
 
 import numpy as np
 import pygame
-from bullet import Bullet
+from constants import BULLET_CAPACITY, BULLET_RADIUS, BULLET_TTL, BULLET_OVERFLOW
 
 class BulletManager:
-    """Manages all bullets in the game with object pooling."""
+    """Fixed-capacity ring buffer of bullets stored as a Struct of Arrays.
 
-    def __init__(self):
-        self.bullets = []
-        self.bullet_pool = []
+    Bullets take consecutive slots after the newest one and are freed by
+    clearing their `alive` flag, both O(1) per bullet. The window of used
+    slots starts at the oldest bullet. Reclaiming walks it from that end
+    only as far as the first live bullet that has not expired; with a
+    shared time-to-live bullets expire in firing order, so this costs the
+    number of slots freed. The ordered slots of the live bullets are cached
+    and rebuilt from the window on the first read after bullets were added
+    or removed. When a volley does not fit after the window, slots freed
+    inside it are reclaimed by packing the live bullets to the front of the
+    store, which moves their slots; only then does `overflow` decide whether
+    the oldest bullets are dropped ('drop_oldest') or the new ones are
+    refused ('refuse'). Memory never grows past `capacity` bullets.
+    """
+
+    def __init__(self, capacity=BULLET_CAPACITY, ttl=BULLET_TTL, overflow=BULLET_OVERFLOW):
+        if overflow not in ('drop_oldest', 'refuse'):
+            raise ValueError(f"Unknown bullet overflow policy: {overflow}")
+        self.capacity = capacity
+        self.ttl = ttl
+        self.overflow = overflow
+        self.position = np.zeros((capacity, 2), dtype=np.float32)
+        self.velocity = np.zeros((capacity, 2), dtype=np.float32)
+        self.damage = np.zeros(capacity, dtype=np.float32)
+        self.color = np.zeros((capacity, 3), dtype=np.uint8)
+        self.team = np.zeros(capacity, dtype=np.int8)
+        self.expires = np.zeros(capacity, dtype=np.float64)  # Clock time at which each bullet expires
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.column_names = ['position', 'velocity', 'damage', 'color', 'team', 'expires']
+        self.rows = np.zeros(0, dtype=np.int64)  # Slots of the live bullets, oldest first (None when stale)
+
+        self.start = 0  # Slot of the oldest bullet in the window
+        self.size = 0  # Slots in the window, freed ones included
+        self.count = 0  # Live bullets
+        self.clock = 0.0
+
+        # Pool statistics
+        self.high_water = 0
+        self.emitted = 0
+        self.expired = 0
+        self.dropped = 0
+        self.refused = 0
+
+    def __len__(self):
+        return self.count
+
+    def live_rows(self):
+        """Slots of the live bullets, oldest first."""
+        if self.rows is None:
+            window = (self.start + np.arange(self.size)) % self.capacity
+            self.rows = window[self.alive[window]]
+        return self.rows
+
+    @property
+    def positions(self):
+        """Positions of the live bullets, aligned with `live_rows`."""
+        return self.position[self.live_rows()]
+
+    @property
+    def teams(self):
+        return self.team[self.live_rows()]
+
+    @property
+    def damages(self):
+        return self.damage[self.live_rows()]
+
+    def max_speed(self):
+        """Speed of the fastest live bullet."""
+        return float(np.max(np.linalg.norm(self.velocity[self.live_rows()], axis=1), initial=0))
+
+    def stats(self):
+        """Return the pool usage counters."""
+        return {
+            'capacity': self.capacity,
+            'live': self.count,
+            'high_water': self.high_water,
+            'emitted': self.emitted,
+            'expired': self.expired,
+            'dropped': self.dropped,
+            'refused': self.refused,
+        }
+
+    def allocate(self, count):
+        """Reserve `count` consecutive slots after the newest bullet, applying the overflow policy.
+
+        Returns the slots and the slice of the request that got them.
+        Refusing keeps the start of the request; dropping the oldest keeps
+        its end. Slots handed out earlier may move if freed slots have to be
+        reclaimed.
+        """
+        requested = count
+        kept = slice(0, count)
+        if count > self.capacity - self.count and self.overflow == 'refuse':
+            count = self.capacity - self.count
+            self.refused += requested - count
+            kept = slice(0, count)
+        elif count > self.capacity:
+            # Only the newest `capacity` bullets of the volley can exist at once
+            count = self.capacity
+            self.dropped += requested - count
+            kept = slice(requested - count, requested)
+        if count > self.capacity - self.size and self.size > self.count:
+            self.compact()
+        if count > self.capacity - self.size:
+            self.evict(count - (self.capacity - self.size))
+        slots = (self.start + self.size + np.arange(count)) % self.capacity
+        self.size += count
+        return slots, kept
+
+    def compact(self):
+        """Pack the live bullets, oldest first, into the leading slots to reclaim the freed slots in the window."""
+        rows = self.live_rows()
+        for name in self.column_names:
+            column = getattr(self, name)
+            column[:len(rows)] = column[rows]
+        self.alive[:] = False
+        self.alive[:len(rows)] = True
+        self.rows = np.arange(len(rows))
+        self.start = 0
+        self.size = len(rows)
+
+    def evict(self, count):
+        """Drop the `count` oldest slots of the window, live or not."""
+        slots = (self.start + np.arange(count)) % self.capacity
+        dropped = int(np.count_nonzero(self.alive[slots]))
+        self.alive[slots] = False
+        self.dropped += dropped
+        self.count -= dropped
+        if self.rows is not None:
+            self.rows = self.rows[dropped:]
+        self.start = (self.start + count) % self.capacity
+        self.size -= count
+
+    def add_bullets(self, positions, targets, damage, colors, teams, speed=300.0, ttl=None):
+        """Emit one bullet per row from `positions` towards `targets` and return their slots.
+
+        `damage`, `colors` and `teams` may be per-bullet arrays or shared
+        scalars. Directions are normalized in one pass; a bullet fired at its
+        own position stands still. Bullets refused or dropped on overflow get
+        no slot.
+        """
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 2)
+        directions = np.asarray(targets, dtype=np.float32).reshape(-1, 2) - positions
+        lengths = np.linalg.norm(directions, axis=1, keepdims=True)
+        directions = np.divide(directions, lengths, out=np.zeros_like(directions), where=lengths > 0)
+
+        slots, kept = self.allocate(len(positions))
+        self.position[slots] = positions[kept]
+        self.velocity[slots] = directions[kept] * speed
+        self.damage[slots] = np.broadcast_to(damage, len(positions))[kept]
+        self.color[slots] = np.broadcast_to(colors, (len(positions), 3))[kept]
+        self.team[slots] = np.broadcast_to(teams, len(positions))[kept]
+        self.expires[slots] = self.clock + (self.ttl if ttl is None else ttl)
+        self.alive[slots] = True
+        self.rows = None
+        self.count += len(slots)
+        self.emitted += len(slots)
+        self.high_water = max(self.high_water, self.count)
+        return slots
 
     def add_bullet(self, position, velocity, damage, color, team, speed=300.0):
-        """Adds a bullet to the list."""
-        if self.bullet_pool:
-            bullet = self.bullet_pool.pop()
-            bullet.reset(position, velocity, damage, color, team, speed)
-        else:
-            bullet = Bullet(position, velocity, damage, color, team, speed)
-        self.bullets.append(bullet)
-        return bullet
-
-    def update(self, dt, screen_rect, walls_group):
-        """Update bullets and handle off-screen removal."""
-        for bullet in self.bullets[:]:
-            bullet.update(dt)
-            if not screen_rect.collidepoint(bullet.position):
-                self.remove_bullet(bullet)
-            elif pygame.sprite.spritecollide(bullet, walls_group, False):
-                self.remove_bullet(bullet)
-
-    def remove_bullet(self, bullet):
-        """Removes a bullet and returns it to the pool."""
-        self.bullets.remove(bullet)
-        self.bullet_pool.append(bullet)
+        """Adds a single bullet travelling along `velocity` and returns its slot, or -1 if refused."""
+        position = np.asarray(position, dtype=np.float32)
+        slots = self.add_bullets(position, position + velocity, damage, color, team, speed)
+        return slots[0] if len(slots) else -1
+
+    def update(self, dt, screen_rect, obstacles):
+        """Age and move bullets, then free those that expired, left the screen or hit an obstacle."""
+        self.clock += dt
+        self.reclaim()
+        if self.count == 0:
+            return
+        rows = self.live_rows()
+        positions = self.position[rows] + self.velocity[rows] * dt
+        self.position[rows] = positions
+        on_screen = ((positions[:, 0] >= screen_rect.left) & (positions[:, 0] < screen_rect.right) &
+                     (positions[:, 1] >= screen_rect.top) & (positions[:, 1] < screen_rect.bottom))
+        # Bullets fired with a longer time-to-live than an older one wait behind it in the window
+        expired = self.expires[rows] <= self.clock
+        self.expired += int(np.count_nonzero(expired))
+        self.remove_bullets(rows[~on_screen | expired | obstacles.hits(positions)])
+
+    def reclaim(self):
+        """Free expired bullets from the oldest end of the window and trim freed slots there.
+
+        Slots are checked in growing blocks from the oldest one, up to the
+        first live bullet that has not expired. A bullet that expires behind
+        a longer-lived one is freed by `update` instead.
+        """
+        trimmed, freed, block = 0, 0, 32
+        while trimmed < self.size:
+            slots = (self.start + trimmed + np.arange(min(block, self.size - trimmed))) % self.capacity
+            pending = np.nonzero(self.alive[slots] & (self.expires[slots] > self.clock))[0]
+            if len(pending):
+                slots = slots[:pending[0]]
+            expired = slots[self.alive[slots]]
+            self.alive[expired] = False
+            freed += len(expired)
+            trimmed += len(slots)
+            if len(pending):
+                break
+            block *= 2
+        self.count -= freed
+        self.expired += freed
+        if self.rows is not None:
+            self.rows = self.rows[freed:]
+        self.start = (self.start + trimmed) % self.capacity
+        self.size -= trimmed
+
+    def remove_bullets(self, slots):
+        """Free the live bullets in `slots`."""
+        slots = np.asarray(slots, dtype=np.int64)
+        self.count -= int(np.count_nonzero(self.alive[slots]))
+        self.alive[slots] = False
+        self.rows = None
+        self.reclaim()
 
     def render(self, screen):
         """Render all bullets."""
-        for bullet in self.bullets:
-            bullet.render(screen)
+        rows = self.live_rows()
+        for position, color in zip(self.position[rows].astype(int), self.color[rows]):
+            pygame.draw.circle(screen, tuple(int(c) for c in color), (position[0], position[1]), BULLET_RADIUS)
@@ -0,0 +1,47 @@
+# cell_aggregates.py
+
+import numpy as np
+from constants import WINDOW_WIDTH, WINDOW_HEIGHT
+
+class CellAggregates:
+    """Per-cell sums of unit positions and velocities for alignment and cohesion.
+
+    The sums are recomputed every frame with one bincount per column over the
+    live units: every unit moves each frame, so tracking per-unit changes
+    costs more than starting over. Units off the field count towards the
+    nearest border cell.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.columns = int(np.ceil(WINDOW_WIDTH / cell_size))
+        self.rows = int(np.ceil(WINDOW_HEIGHT / cell_size))
+        self.num_cells = self.columns * self.rows
+
+        self.position_sum = np.zeros((self.num_cells, 2), dtype=np.float64)
+        self.velocity_sum = np.zeros((self.num_cells, 2), dtype=np.float64)
+        self.count = np.zeros(self.num_cells, dtype=np.int64)
+
+    def cell_ids(self, positions):
+        """Return the flat cell id of each position, clamped to the field."""
+        cells = np.floor(positions / self.cell_size).astype(np.int64)
+        column = np.clip(cells[:, 0], 0, self.columns - 1)
+        row = np.clip(cells[:, 1], 0, self.rows - 1)
+        return row * self.columns + column
+
+    def rebuild(self, positions, velocities):
+        """Recompute every cell sum from the given unit positions and velocities."""
+        cells = self.cell_ids(positions)
+        for axis in range(2):
+            self.position_sum[:, axis] = np.bincount(cells, weights=positions[:, axis], minlength=self.num_cells)
+            self.velocity_sum[:, axis] = np.bincount(cells, weights=velocities[:, axis], minlength=self.num_cells)
+        self.count[:] = np.bincount(cells, minlength=self.num_cells)
+
+    def lookup(self, positions):
+        """Return the alignment (mean velocity) and cohesion center (mean position) of each position's cell."""
+        cells = self.cell_ids(positions)
+        counts = np.maximum(self.count[cells], 1)[:, np.newaxis]
+        alignment = self.velocity_sum[cells] / counts
+        cohesion_center = np.where(self.count[cells][:, np.newaxis] > 0,
+                                   self.position_sum[cells] / counts, positions)
+        return alignment.astype(np.float32), cohesion_center.astype(np.float32)
@@ -2,47 +2,45 @@
 
 import numpy as np
 
-def check_bullet_collisions(spatial_grid, unit_data, bullet_manager):
-    """Check for collisions between bullets and units using spatial grid."""
-    for cell_key, cell_contents in spatial_grid.grid.items():
-        bullets = cell_contents.get('bullets', [])
-        if not bullets:
-            continue
-
-        # Get units in the same and adjacent cells
-        neighbor_cells = spatial_grid.get_adjacent_cells(cell_key) + [cell_key]
-        unit_indices = []
-        for n_cell in neighbor_cells:
-            unit_indices.extend(spatial_grid.grid.get(n_cell, {}).get('units', []))
-        if not unit_indices:
-            continue
-
-        # Prepare unit data
-        unit_positions = unit_data.position[unit_indices]
-        unit_radii = unit_data.radius[unit_indices]
-        unit_teams = unit_data.team[unit_indices]
-
-        # Prepare bullet data
-        bullet_positions = np.array([bullet.position for bullet in bullets])
-        bullet_teams = np.array([bullet.team for bullet in bullets])
-        bullet_objects = bullets
-
-        # Compute differences and distances
-        diffs = unit_positions[:, np.newaxis, :] - bullet_positions[np.newaxis, :, :]
-        distances = np.linalg.norm(diffs, axis=2)
-
-        # Collision mask
-        collision_mask = (distances <= unit_radii[:, np.newaxis]) & \
-                         (unit_teams[:, np.newaxis] != bullet_teams[np.newaxis, :])
-
-        # Handle collisions
-        unit_indices_array, bullet_indices_array = np.nonzero(collision_mask)
-        for u_idx, b_idx in zip(unit_indices_array, bullet_indices_array):
-            unit_global_idx = unit_indices[u_idx]
-            bullet = bullet_objects[b_idx]
-
-            # Apply damage
-            unit_data.health[unit_global_idx] -= bullet.damage
-
-            # Remove bullet
-            bullet_manager.remove_bullet(bullet)
+def check_bullet_collisions(spatial_index, unit_data, bullet_manager, rebuild=True):
+    """Check for collisions between bullets and enemy units using a team-partitioned index over the units.
+
+    With `rebuild` False the index from the previous call is reused, which
+    is valid while no unit has moved, joined or left since.
+    """
+    active_indices = np.where(unit_data.active)[0]
+    if len(bullet_manager) == 0 or len(active_indices) == 0:
+        return
+
+    # Prepare unit data
+    unit_positions = unit_data.position[active_indices]
+    unit_radii = unit_data.radius[active_indices]
+    unit_teams = unit_data.team[active_indices]
+
+    # Prepare bullet data
+    bullet_slots = bullet_manager.live_rows()
+    bullet_positions = bullet_manager.position[bullet_slots]
+    bullet_teams = bullet_manager.team[bullet_slots]
+    bullet_damages = bullet_manager.damage[bullet_slots]
+
+    # Candidate pairs with enemy units within reach of the largest unit
+    if rebuild:
+        spatial_index.build(unit_positions, unit_teams, active_indices)
+    bullet_rows, unit_rows = spatial_index.query_enemies(
+        bullet_positions, bullet_teams, float(unit_radii.max()) + 1e-3
+    )
+
+    # Collision mask
+    distances = np.linalg.norm(bullet_positions[bullet_rows] - unit_positions[unit_rows], axis=1)
+    collision_mask = distances <= unit_radii[unit_rows]
+    bullet_rows, unit_rows = bullet_rows[collision_mask], unit_rows[collision_mask]
+
+    # Each bullet is spent on the first unit it hits
+    bullet_rows, first_hits = np.unique(bullet_rows, return_index=True)
+    unit_rows = unit_rows[first_hits]
+
+    # Apply damage
+    np.add.at(unit_data.health, active_indices[unit_rows], -bullet_damages[bullet_rows])
+
+    # Remove bullets
+    bullet_manager.remove_bullets(bullet_slots[bullet_rows])
@@ -0,0 +1,52 @@
+# combat.py
+
+import numpy as np
+from constants import WINDOW_HEIGHT, TOUCHDOWN_LINE_OFFSET
+
+def resolve_combat(unit_data, indices, dt):
+    """Tick the cooldowns of the given units and let every ready unit attack its target.
+
+    Runs after movement on the targets kept by the pursuit kernel. Melee
+    units hit a target they touch (their attack range plus both radii) and
+    the damage is applied to its health at once; ranged units shoot a target
+    within their attack range. Returns the slots of the shooters and the
+    positions they aim at, for the bullet store.
+    """
+    cooldowns = np.maximum(unit_data.cooldown[indices] - dt, 0)
+    targets = unit_data.target[indices]
+    tracked = np.nonzero(targets >= 0)[0]
+    tracked = tracked[unit_data.active[targets[tracked]]]
+    attackers, victims = indices[tracked], targets[tracked]
+
+    distances = np.linalg.norm(unit_data.position[victims] - unit_data.position[attackers], axis=1)
+    ranged = unit_data.is_ranged[attackers]
+    reach = unit_data.attack_range[attackers] + np.where(
+        ranged, 0, unit_data.radius[attackers] + unit_data.radius[victims]
+    )
+    ready = (cooldowns[tracked] <= 0) & (distances <= reach)
+
+    melee = ready & ~ranged
+    np.add.at(unit_data.health, victims[melee], -unit_data.damage[attackers[melee]])
+
+    attack_speeds = unit_data.attack_speed[attackers[ready]]
+    cooldowns[tracked[ready]] = np.where(attack_speeds > 0, 1 / np.maximum(attack_speeds, 1e-9), 0.1)
+    unit_data.cooldown[indices] = cooldowns
+
+    shooting = ready & ranged
+    return attackers[shooting], unit_data.position[victims[shooting]].copy()
+
+def score_touchdowns(unit_data, indices):
+    """Remove the given units that crossed the enemy touchdown line and return the damage they deal.
+
+    Returns (damage to the player, damage to the opponent); each scoring
+    unit deals its own damage.
+    """
+    teams = unit_data.team[indices]
+    ys = unit_data.position[indices, 1]
+    damages = unit_data.damage[indices]
+    player_scored = (teams == 1) & (ys <= TOUCHDOWN_LINE_OFFSET)
+    opponent_scored = (teams == 2) & (ys >= WINDOW_HEIGHT - TOUCHDOWN_LINE_OFFSET)
+    damage_to_opponent = float(np.sum(damages, where=player_scored))
+    damage_to_player = float(np.sum(damages, where=opponent_scored))
+    unit_data.remove_units(indices[player_scored | opponent_scored])
+    return damage_to_player, damage_to_opponent
@@ -41,17 +41,102 @@ RATE_OF_GAIN = 1.0
 # Destinations
 DESTINATION1 = (WINDOW_WIDTH / 2, 0)
 DESTINATION2 = (WINDOW_WIDTH / 2, WINDOW_HEIGHT)
+FLOW_FIELD_CELL_SIZE = 10  # Node spacing of the precomputed goal flow fields
+
+# Map obstacles, rasterized into a signed-distance field
+OBSTACLE_RECTS = []  # Walls as (x, y, width, height)
+OBSTACLE_CIRCLES = []  # Round obstacles as ((x, y), radius)
+SDF_CELL_SIZE = 10  # Node spacing of the signed-distance field
+OBSTACLE_AVOID_DISTANCE = 30  # Units start steering away from obstacles this close
+OBSTACLE_WEIGHT = 1.0
+OBSTACLE_COLOR = (90, 90, 90)
+
+# Bullets
+BULLET_CAPACITY = 4096  # Most bullets alive at once; the store never grows
+BULLET_TTL = 4.0  # Seconds a bullet lives before it is reclaimed
+BULLET_OVERFLOW = 'drop_oldest'  # When full: 'drop_oldest' or 'refuse' new bullets
+BULLET_RADIUS = 5
 
 # Boid behavior parameters
 VISION_RADIUS = 200
 ATTACK_RADIUS = 100
 MAX_DENSITY = 10
+COHESION_RADIUS = 50  # Same-team neighbors within this distance pull a unit together
+
+# Verlet neighbor lists for separation and cohesion
+USE_NEIGHBOR_LIST = True
+NEIGHBOR_SKIN = 10  # Extra list radius; the list is rebuilt once a unit moves skin / 2
 
 # Spatial grid cell size
 CELL_SIZE = max(VISION_RADIUS, SEPARATION_DISTANCE)
 
+# Spatial index used for neighbor pairs and bullet hits:
+# 'grid', 'multigrid', 'sweep', 'quadtree', 'loose_quadtree' or 'kdtree'
+SPATIAL_INDEX = 'multigrid'
+SPATIAL_INDEX_CELL_SIZE = 64  # Cell size of the uniform grid index
+MULTIGRID_BASE_CELL_SIZE = 16  # Finest cell of the multi-resolution grid; each level doubles it
+MULTIGRID_LEVELS = 5  # 16, 32, 64, 128 and 256 px cells
+
+# Quadtree parameters
+MAX_OBJECTS = 10  # Points a node holds before it splits
+MAX_LEVELS = 8  # Maximum depth of the tree
+LOOSE_QUADTREE_LEVELS = 5  # Depth of the loose quadtree (leaves are 1/32 of the field per side)
+LOOSENESS = 0.5  # Loose node bounds grow by this fraction of the node size on each side
+
+# Barnes-Hut far field: alignment over each unit's whole vision range, and cohesion without the neighbor list
+FAR_FIELD = False
+FAR_FIELD_THETA = 0.5  # Largest node size / distance treated as one pseudo-unit (0 is exact)
+
+# Morton-order reordering of unit slots
+SPATIAL_SORT_INTERVAL = 120  # Frames between reorders (0 disables)
+SPATIAL_SORT_CELL_SIZE = 50  # Cell size used for the Z-order codes
+
+# Simulation level of detail: units far from combat are stepped less often
+SIMULATION_LOD = True
+LOD_CELL_SIZE = 50  # Cell size of the occupancy grid that decides the tiers
+LOD_INTERVAL = 4  # Frames between steps of a low-rate unit
+LOD_SPARSE_COUNT = 8  # Most units a cell may hold for its units to be low-rate
+SLEEP_SPEED = 2.0  # Units slower than this (px/s)...
+SLEEP_ACCELERATION = 5.0  # ...and accelerating less than this (px/s^2)...
+SLEEP_FRAMES = 30  # ...for this many steps fall asleep
+SLEEP_BUMP_DISTANCE = SEPARATION_DISTANCE  # A moving ally this close wakes a sleeping unit
+
+# Squads: units spawned together move as one formation until they take casualties or sight an enemy
+SQUAD_FORMATION_WEIGHT = 4.0  # Weight of the steering towards a member's formation slot
+SQUAD_FORMATION_GAIN = 1.0  # Slot error (px) closed per second on top of the squad velocity
+SQUAD_ENGAGE_MARGIN = 20  # Extra distance beyond member vision at which a squad breaks up
+
+# Target tracking: units keep their target and search for the nearest enemy on a staggered schedule
+RETARGET_INTERVAL = 8  # Frames between nearest-enemy searches of a unit that still has a valid target
+
+# Adaptive substepping: bullets and separation are split into substeps when a frame would move them too far
+COURANT_NUMBER = 0.5  # Fraction of the resolved length (unit radius, separation distance) allowed per substep
+MAX_SUBSTEPS = 8  # Upper bound on substeps per frame for each subsystem
+
 # Maximum number of units
 MAX_UNITS = 5000  # Adjust based on expected maximum units
+TEAMS = (1, 2)  # Each team owns a contiguous block of MAX_UNITS unit slots
 
 # Other constants
 UNIT_POOL_SIZE = MAX_UNITS
+
+# Parallel force computation
+PARALLEL_BACKEND = 'threads'  # 'threads' (tiled thread pool) or 'processes' (shared-memory bands)
+# Threads used for the force phase (1 = run tiles inline). Opt-in: the tile kernels hold the GIL for much of
+# their work, so more threads only pay off with many units on many cores; at 2000 units 4 threads were slower
+FORCE_WORKERS = 1
+TILE_CELLS = 2  # Tile edge length in grid cells (each tile also reads a one-cell halo)
+KERNEL_BLOCK_SIZE = 256  # Units per kernel block, bounds the size of pairwise temporaries
+BAND_WORKERS = 4  # Worker processes for the 'processes' backend, one per horizontal band
+GHOST_ZONE_HEIGHT = CELL_SIZE  # Least distance past its band edges a worker reads; the largest vision range widens it
+
+# Load balancing for the parallel backends
+LOAD_BALANCING = True
+REBALANCE_INTERVAL = 30  # Frames between boundary moves
+BULLET_LOAD_WEIGHT = 0.5  # Cost of a bullet relative to a unit when measuring cell load
+LOAD_SMOOTHING = 0.3  # Weight of the newest step times in the per-cell cost estimate
+TILES_PER_WORKER = 2  # Balanced tiles per thread, so a slow tile does not stall the pool
+
+# Distributed simulation
+COORDINATOR_HOST = '127.0.0.1'
+COORDINATOR_PORT = 5757
@@ -0,0 +1,427 @@
+# distributed.py
+
+import argparse
+import socket
+import struct
+import threading
+import time
+import multiprocessing
+import numpy as np
+from constants import (
+    WINDOW_WIDTH, WINDOW_HEIGHT, PLAYER_MAX_HEALTH, OPPONENT_MAX_HEALTH,
+    GHOST_ZONE_HEIGHT, CELL_SIZE, UNIT_RADIUS, COORDINATOR_HOST, COORDINATOR_PORT, LOAD_BALANCING
+)
+from unit_data import UnitData
+from unit_manager import UnitManager
+from band_workers import band_boundaries, assign_bands, ghost_zone_height
+from load_balancer import LoadBalancer
+from combat import resolve_combat, score_touchdowns
+
+# Frame kinds
+HELLO, PEERS, READY, SPAWN, TICK, HALO, MIGRATE, REPORT, STOP = range(9)
+
+# Every frame is a fixed header followed by `length` payload bytes
+FRAME_HEADER = struct.Struct('<BII')  # kind, tick, payload length
+HELLO_PAYLOAD = struct.Struct('<IH')  # rank, listening port
+# A tick is followed by the inner band edges ('<f8'), a report by the unit count of every cell row ('<f4')
+TICK_PAYLOAD = struct.Struct('<ff')  # dt, halo height
+REPORT_PAYLOAD = struct.Struct('<Iffif')  # units, damage to player, damage to opponent, shots, compute time
+CELL_ROWS = int(np.ceil(WINDOW_HEIGHT / CELL_SIZE))
+
+# Full unit state, sent when seeding a node or migrating a unit to a neighbor
+UNIT_RECORD = np.dtype([
+    ('team', 'i1'), ('is_ranged', '?'), ('color', 'u1', (3,)),
+    ('position', '<f4', (2,)), ('velocity', '<f4', (2,)),
+    ('health', '<f4'), ('damage', '<f4'), ('speed', '<f4'),
+    ('attack_range', '<f4'), ('vision_range', '<f4'), ('cooldown', '<f4'),
+    ('attack_speed', '<f4'), ('radius', '<f4')
+])
+
+# The part of a unit its neighbors read when it sits in their halo
+HALO_RECORD = np.dtype([('team', 'i1'), ('position', '<f4', (2,)), ('velocity', '<f4', (2,))])
+
+def send_frame(sock, kind, tick, payload=b''):
+    """Send one framed message."""
+    sock.sendall(FRAME_HEADER.pack(kind, tick, len(payload)) + payload)
+
+def recv_exact(sock, size):
+    """Read exactly `size` bytes from the socket."""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Peer closed the connection")
+        received += count
+    return bytes(buffer)
+
+def recv_frame(sock, expected=None):
+    """Receive one framed message, optionally checking its kind."""
+    kind, tick, length = FRAME_HEADER.unpack(recv_exact(sock, FRAME_HEADER.size))
+    payload = recv_exact(sock, length) if length else b''
+    if expected is not None and kind != expected:
+        raise ConnectionError(f"Expected frame kind {expected}, got {kind}")
+    return kind, tick, payload
+
+def pack_units(unit_data, indices):
+    """Pack full unit records for the given slots."""
+    records = np.zeros(len(indices), dtype=UNIT_RECORD)
+    for name in UNIT_RECORD.names:
+        records[name] = getattr(unit_data, name)[indices]
+    return records.tobytes()
+
+def pack_halo(unit_data, indices):
+    """Pack the halo view of the given slots."""
+    records = np.zeros(len(indices), dtype=HALO_RECORD)
+    for name in HALO_RECORD.names:
+        records[name] = getattr(unit_data, name)[indices]
+    return records.tobytes()
+
+def add_unit_records(unit_data, records):
+    """Add unpacked unit records to a UnitData, keeping their cooldowns."""
+    for record in records:
+        idx = unit_data.add_unit(
+            team=record['team'],
+            position=record['position'],
+            velocity=record['velocity'],
+            health=record['health'],
+            damage=record['damage'],
+            speed=record['speed'],
+            attack_range=record['attack_range'],
+            vision_range=record['vision_range'],
+            attack_speed=record['attack_speed'],
+            is_ranged=record['is_ranged'],
+            color=record['color'],
+            radius=record['radius']
+        )
+        unit_data.cooldown[idx] = record['cooldown']
+
+def random_scenario(num_units, seed=0):
+    """Generate unit records for both teams spread over their own halves of the field."""
+    rng = np.random.default_rng(seed)
+    records = np.zeros(num_units, dtype=UNIT_RECORD)
+    records['team'] = 1 + (np.arange(num_units) % 2)
+    records['is_ranged'] = rng.random(num_units) >= 0.9
+    x = rng.uniform(UNIT_RADIUS, WINDOW_WIDTH - UNIT_RADIUS, num_units)
+    half = rng.uniform(UNIT_RADIUS, WINDOW_HEIGHT / 2 - UNIT_RADIUS, num_units)
+    y = np.where(records['team'] == 1, WINDOW_HEIGHT / 2 + half, half)
+    records['position'] = np.stack((x, y), axis=1)
+    records['damage'] = rng.integers(1, 4, num_units)
+    records['health'] = rng.integers(1, 4, num_units)
+    records['speed'] = rng.integers(1, 4, num_units)
+    records['attack_range'] = np.where(records['is_ranged'], 200, 0)
+    records['vision_range'] = np.where(records['is_ranged'], 250, 100)
+    records['attack_speed'] = np.where(records['is_ranged'],
+                                       np.maximum(records['speed'] / 4, 0.1), records['speed'])
+    records['cooldown'] = 1 / records['attack_speed']
+    records['color'] = np.where(records['is_ranged'][:, np.newaxis], (255, 0, 0), (0, 0, 255))
+    records['radius'] = UNIT_RADIUS
+    return records
+
+class SimulationNode:
+    """Simulates the units inside one horizontal band of the field and trades edges with its neighbors."""
+
+    def __init__(self, rank, num_nodes, coordinator_address):
+        self.rank = rank
+        self.num_nodes = num_nodes
+        self.halo_height = GHOST_ZONE_HEIGHT  # Replaced by the height sent with every tick
+        self.boundaries = band_boundaries(num_nodes)
+        self.unit_data = UnitData()
+        self.unit_manager = UnitManager(self.unit_data, force_workers=1)
+        self.neighbors = {}  # 'up' (rank - 1) and 'down' (rank + 1) sockets
+
+        self.listener = socket.create_server(('', 0))
+        self.coordinator = socket.create_connection(coordinator_address)
+        self.coordinator.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def connect(self):
+        """Register with the coordinator and open the links to the neighboring nodes."""
+        port = self.listener.getsockname()[1]
+        send_frame(self.coordinator, HELLO, 0, HELLO_PAYLOAD.pack(self.rank, port))
+        _, _, payload = recv_frame(self.coordinator, PEERS)
+        down_port, = struct.unpack_from('<H', payload)
+        down_host = payload[2:].decode()
+        if down_port:
+            self.neighbors['down'] = socket.create_connection((down_host, down_port))
+        if self.rank > 0:
+            self.neighbors['up'], _ = self.listener.accept()
+        for sock in self.neighbors.values():
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.listener.close()
+        send_frame(self.coordinator, READY, 0)
+
+    def exchange(self, kind, tick, payloads):
+        """Send one frame to each neighbor and receive theirs.
+
+        Sends run on threads so two neighbors pushing large frames at each
+        other cannot deadlock on full socket buffers.
+        """
+        senders = [threading.Thread(target=send_frame, args=(self.neighbors[side], kind, tick, payload))
+                   for side, payload in payloads.items()]
+        for sender in senders:
+            sender.start()
+        received = {side: recv_frame(self.neighbors[side], kind)[2] for side in payloads}
+        for sender in senders:
+            sender.join()
+        return received
+
+    def row_loads(self):
+        """Count the owned units in every row of cells, for the coordinator's load balancer."""
+        rows = np.floor(self.unit_data.position[self.unit_data.active, 1] / CELL_SIZE).astype(np.int64)
+        return np.bincount(np.clip(rows, 0, CELL_ROWS - 1), minlength=CELL_ROWS).astype('<f4')
+
+    def edge_units(self, indices, positions):
+        """Split units by which neighbor's halo they fall into."""
+        top, bottom = self.boundaries[self.rank], self.boundaries[self.rank + 1]
+        edges = {}
+        if 'up' in self.neighbors:
+            edges['up'] = indices[positions[:, 1] < top + self.halo_height]
+        if 'down' in self.neighbors:
+            edges['down'] = indices[positions[:, 1] >= bottom - self.halo_height]
+        return edges
+
+    def step(self, tick, dt):
+        """Advance the owned units one tick and return (damage to player, damage to opponent, shots, compute time).
+
+        The compute time covers only the local work of the tick; time spent
+        waiting on the neighbors in the halo and migration exchanges is left
+        out, so it measures this node's load.
+        """
+        unit_data = self.unit_data
+        owned = np.nonzero(unit_data.active)[0]
+        count = len(owned)
+
+        # Halo exchange: neighbors get the units within reach of their edge
+        edges = self.edge_units(owned, unit_data.position[owned])
+        received = self.exchange(HALO, tick, {side: pack_halo(unit_data, edge) for side, edge in edges.items()})
+        ghosts = np.concatenate([np.frombuffer(payload, dtype=HALO_RECORD) for payload in received.values()]
+                                or [np.zeros(0, dtype=HALO_RECORD)])
+        start = time.perf_counter()
+
+        # Owned units followed by ghost rows that only serve as neighbors
+        positions = np.concatenate([unit_data.position[owned], ghosts['position']])
+        velocities = np.concatenate([unit_data.velocity[owned], ghosts['velocity']])
+        self.unit_manager.cell_aggregates.rebuild(positions, velocities)
+        alignment, cohesion_center = self.unit_manager.cell_aggregates.lookup(positions)
+        units = self.unit_manager.gather_units(owned, alignment[:count], cohesion_center[:count])
+        for key, column in units.items():
+            units[key] = np.concatenate([column, np.zeros((len(ghosts),) + column.shape[1:], dtype=column.dtype)])
+        units['position'][count:] = ghosts['position']
+        units['velocity'][count:] = ghosts['velocity']
+        units['team'][count:] = ghosts['team']
+        units['alignment'][count:] = alignment[count:]
+        units['cohesion_center'][count:] = cohesion_center[count:]
+        units['index'][count:] = -1  # Ghosts have no local slot, so they are never kept as targets
+
+        forces, targets = self.unit_manager.force_executor.compute_forces(units, dt, np.arange(count))
+        new_positions, new_velocities = self.unit_manager.integrate(
+            units['position'][:count], units['velocity'][:count], units['team'][:count],
+            units['max_speed'][:count], forces, dt
+        )
+        unit_data.position[owned] = new_positions
+        unit_data.velocity[owned] = new_velocities
+        unit_data.target[owned] = targets
+        # Targets are local slots, so units only attack enemies owned by this node
+        shooters, _ = resolve_combat(unit_data, owned, dt)
+
+        damage_to_player, damage_to_opponent = self.process_touchdowns(owned)
+        unit_data.remove_dead_units()
+
+        # Migration: units that left the band move to the neighbor now containing them
+        remaining = np.nonzero(unit_data.active)[0]
+        bands = assign_bands(self.boundaries, unit_data.position[remaining, 1])
+        leaving = {}
+        if 'up' in self.neighbors:
+            leaving['up'] = remaining[bands < self.rank]
+        if 'down' in self.neighbors:
+            leaving['down'] = remaining[bands > self.rank]
+        compute_time = time.perf_counter() - start
+        received = self.exchange(MIGRATE, tick, {side: pack_units(unit_data, indices)
+                                                 for side, indices in leaving.items()})
+        start = time.perf_counter()
+        for indices in leaving.values():
+            for idx in indices:
+                unit_data.remove_unit(idx)
+        for payload in received.values():
+            add_unit_records(unit_data, np.frombuffer(payload, dtype=UNIT_RECORD))
+        compute_time += time.perf_counter() - start
+
+        return damage_to_player, damage_to_opponent, len(shooters), compute_time
+
+    def process_touchdowns(self, indices):
+        """Remove units that crossed the touchdown lines and return the damage dealt to each side."""
+        return score_touchdowns(self.unit_data, indices)
+
+    def run(self):
+        """Serve coordinator requests until told to stop."""
+        self.connect()
+        try:
+            while True:
+                kind, tick, payload = recv_frame(self.coordinator)
+                if kind == STOP:
+                    break
+                if kind == SPAWN:
+                    add_unit_records(self.unit_data, np.frombuffer(payload, dtype=UNIT_RECORD))
+                elif kind == TICK:
+                    dt, self.halo_height = TICK_PAYLOAD.unpack_from(payload)
+                    # Units outside moved edges migrate one band per tick until they reach their band
+                    inner = np.frombuffer(payload, dtype='<f8', offset=TICK_PAYLOAD.size)
+                    self.boundaries = np.concatenate(([-np.inf], inner, [np.inf]))
+                    damage_to_player, damage_to_opponent, shots, compute_time = self.step(tick, dt)
+                    report = REPORT_PAYLOAD.pack(
+                        int(np.count_nonzero(self.unit_data.active)), damage_to_player,
+                        damage_to_opponent, shots, compute_time
+                    ) + self.row_loads().tobytes()
+                    send_frame(self.coordinator, REPORT, tick, report)
+        finally:
+            for sock in self.neighbors.values():
+                sock.close()
+            self.coordinator.close()
+
+class Coordinator:
+    """Drives the tick barrier for a set of simulation nodes and owns the global game state.
+
+    With a load balancer, the band edges are redrawn every few ticks from the
+    unit counts per cell row and the local compute times the nodes report,
+    and sent with the next tick.
+    """
+
+    def __init__(self, num_nodes, host=COORDINATOR_HOST, port=COORDINATOR_PORT, balancer=None):
+        self.num_nodes = num_nodes
+        self.boundaries = band_boundaries(num_nodes)
+        self.halo_height = GHOST_ZONE_HEIGHT  # Sized to the largest vision range once the nodes are seeded
+        self.balancer = balancer
+        self.server = socket.create_server((host, port))
+        self.address = self.server.getsockname()[:2]
+        self.nodes = []
+        self.player_health = PLAYER_MAX_HEALTH
+        self.opponent_health = OPPONENT_MAX_HEALTH
+        self.tick = 0
+
+    def accept_nodes(self):
+        """Wait for every node to register, tell each where its lower neighbor listens, and wait until linked."""
+        registrations = {}
+        while len(registrations) < self.num_nodes:
+            sock, (host, _) = self.server.accept()
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            _, _, payload = recv_frame(sock, HELLO)
+            rank, port = HELLO_PAYLOAD.unpack(payload)
+            registrations[rank] = (sock, host, port)
+        self.nodes = [registrations[rank][0] for rank in range(self.num_nodes)]
+        for rank, sock in enumerate(self.nodes):
+            if rank + 1 < self.num_nodes:
+                _, host, port = registrations[rank + 1]
+                payload = struct.pack('<H', port) + host.encode()
+            else:
+                payload = struct.pack('<H', 0)
+            send_frame(sock, PEERS, 0, payload)
+        for sock in self.nodes:
+            recv_frame(sock, READY)
+
+    def seed(self, records):
+        """Send each node the unit records that start inside its band."""
+        self.halo_height = ghost_zone_height(records['vision_range'])
+        bands = assign_bands(self.boundaries, records['position'][:, 1])
+        for rank, sock in enumerate(self.nodes):
+            send_frame(sock, SPAWN, self.tick, records[bands == rank].tobytes())
+
+    def step(self, dt):
+        """Run one tick on every node and apply the reported touchdowns; return the per-node reports."""
+        payload = TICK_PAYLOAD.pack(dt, self.halo_height) + self.boundaries[1:-1].astype('<f8').tobytes()
+        for sock in self.nodes:
+            send_frame(sock, TICK, self.tick, payload)
+        payloads = [recv_frame(sock, REPORT)[2] for sock in self.nodes]
+        reports = [REPORT_PAYLOAD.unpack_from(payload) for payload in payloads]
+        for _, damage_to_player, damage_to_opponent, _, _ in reports:
+            self.player_health -= damage_to_player
+            self.opponent_health -= damage_to_opponent
+        self.tick += 1
+        if self.balancer is not None and self.balancer.due():
+            row_loads = sum(np.frombuffer(payload, dtype='<f4', offset=REPORT_PAYLOAD.size) for payload in payloads)
+            self.rebalance(row_loads, [report[4] for report in reports])
+        return reports
+
+    def rebalance(self, row_loads, step_times):
+        """Redraw the band edges so every node carries a similar share of the measured load."""
+        cell_keys = np.column_stack((np.zeros(CELL_ROWS, dtype=np.int64), np.arange(CELL_ROWS)))
+        self.balancer.observe_loads(cell_keys, row_loads)
+        self.balancer.record_region_times(step_times)
+        self.boundaries = self.balancer.split_bands(self.num_nodes, WINDOW_HEIGHT)
+
+    def run(self, ticks, dt):
+        """Step until `ticks` have passed or one side runs out of health; return a summary."""
+        step_times = np.zeros(self.num_nodes)
+        reports = []
+        start = time.perf_counter()
+        for _ in range(ticks):
+            reports = self.step(dt)
+            step_times += [report[4] for report in reports]
+            if self.player_health <= 0 or self.opponent_health <= 0:
+                break
+        return {
+            'ticks': self.tick,
+            'wall_time': time.perf_counter() - start,
+            'units_per_node': [report[0] for report in reports],
+            'step_time_per_node': step_times.tolist(),
+            'player_health': self.player_health,
+            'opponent_health': self.opponent_health
+        }
+
+    def close(self):
+        """Stop every node and close the connections."""
+        for sock in self.nodes:
+            try:
+                send_frame(sock, STOP, self.tick)
+            except OSError:
+                pass
+            sock.close()
+        self.nodes = []
+        self.server.close()
+
+def run_node(rank, num_nodes, coordinator_address):
+    """Entry point for a node process."""
+    SimulationNode(rank, num_nodes, tuple(coordinator_address)).run()
+
+def run_coordinator(coordinator, num_units, ticks, dt, seed):
+    """Link the registered nodes, seed them with a scenario and run it."""
+    try:
+        coordinator.accept_nodes()
+        coordinator.seed(random_scenario(num_units, seed))
+        return coordinator.run(ticks, dt)
+    finally:
+        coordinator.close()
+
+def run_local_cluster(num_nodes, num_units, ticks, dt=1 / 60, seed=0):
+    """Run a coordinator and `num_nodes` node processes on this machine and return the summary."""
+    coordinator = Coordinator(num_nodes, port=0, balancer=LoadBalancer() if LOAD_BALANCING else None)
+    processes = [multiprocessing.Process(target=run_node, args=(rank, num_nodes, coordinator.address))
+                 for rank in range(num_nodes)]
+    for process in processes:
+        process.start()
+    try:
+        return run_coordinator(coordinator, num_units, ticks, dt, seed)
+    finally:
+        for process in processes:
+            process.join(timeout=10)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the unit simulation across several nodes.")
+    parser.add_argument('--nodes', type=int, default=4)
+    parser.add_argument('--units', type=int, default=4000)
+    parser.add_argument('--ticks', type=int, default=300)
+    parser.add_argument('--dt', type=float, default=1 / 60)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--serve', action='store_true', help="Run only the coordinator at --coordinator")
+    parser.add_argument('--node', type=int, help="Run only this node rank and connect to --coordinator")
+    parser.add_argument('--coordinator', default=f"{COORDINATOR_HOST}:{COORDINATOR_PORT}")
+    args = parser.parse_args()
+    host, port = args.coordinator.rsplit(':', 1)
+
+    if args.node is not None:
+        run_node(args.node, args.nodes, (host, int(port)))
+    elif args.serve:
+        coordinator = Coordinator(args.nodes, host, int(port), balancer=LoadBalancer() if LOAD_BALANCING else None)
+        print(run_coordinator(coordinator, args.units, args.ticks, args.dt, args.seed))
+    else:
+        print(run_local_cluster(args.nodes, args.units, args.ticks, args.dt, args.seed))
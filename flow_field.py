@@ -0,0 +1,100 @@
+# flow_field.py
+
+import heapq
+import numpy as np
+from constants import WINDOW_WIDTH, WINDOW_HEIGHT, FLOW_FIELD_CELL_SIZE
+
+# 8-connected grid steps (row, column) and their lengths
+NEIGHBOR_STEPS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+class FlowField:
+    """Unit directions towards one destination, precomputed on a grid of nodes and sampled bilinearly.
+
+    Nodes with a clear straight line to the destination point straight at
+    it. The others point at their neighbor on the shortest 8-connected path
+    around blocked nodes, found once with Dijkstra from the destination.
+    Call `rebuild` whenever the obstacles change.
+    """
+
+    def __init__(self, destination, cell_size=FLOW_FIELD_CELL_SIZE, blocked=None):
+        self.destination = np.asarray(destination, dtype=np.float64)
+        self.cell_size = cell_size
+        self.columns = int(np.ceil(WINDOW_WIDTH / cell_size)) + 1
+        self.rows = int(np.ceil(WINDOW_HEIGHT / cell_size)) + 1
+        self.rebuild(blocked)
+
+    def node_positions(self):
+        """Return the (rows, columns, 2) field positions of the grid nodes."""
+        ys, xs = np.mgrid[0:self.rows, 0:self.columns]
+        return np.stack((xs, ys), axis=-1) * float(self.cell_size)
+
+    def rebuild(self, blocked=None):
+        """Recompute every node direction; `blocked` is a (rows, columns) mask of impassable nodes."""
+        self.blocked = (np.zeros((self.rows, self.columns), dtype=bool) if blocked is None
+                        else np.asarray(blocked, dtype=bool))
+        nodes = self.node_positions()
+        offsets = self.destination - nodes
+        lengths = np.linalg.norm(offsets, axis=-1, keepdims=True)
+        self.directions = np.divide(offsets, lengths, out=np.zeros_like(offsets), where=lengths > 0)
+        if not np.any(self.blocked):
+            return
+
+        hidden = ~self.line_of_sight(nodes)
+        distances = self.path_distances()
+        padded = np.pad(distances, 1, constant_values=np.inf)
+        best = np.full(distances.shape, np.inf)
+        for dy, dx in NEIGHBOR_STEPS:
+            neighbor = padded[1 + dy:1 + dy + self.rows, 1 + dx:1 + dx + self.columns]
+            closer = hidden & (neighbor < best)
+            best[closer] = neighbor[closer]
+            self.directions[closer] = np.array([dx, dy]) / np.hypot(dx, dy)
+
+    def line_of_sight(self, nodes):
+        """Return whether the straight segment from each node to the destination avoids blocked nodes."""
+        offsets = self.destination - nodes
+        steps = int(np.ceil(np.max(np.linalg.norm(offsets, axis=-1)) / (self.cell_size / 2))) + 1
+        visible = ~self.blocked
+        for t in np.linspace(0, 1, steps):
+            samples = np.rint((nodes + offsets * t) / self.cell_size).astype(np.int64)
+            columns = np.clip(samples[..., 0], 0, self.columns - 1)
+            rows = np.clip(samples[..., 1], 0, self.rows - 1)
+            visible &= ~self.blocked[rows, columns]
+        return visible
+
+    def path_distances(self):
+        """Dijkstra path length from the destination to every node over the unblocked nodes."""
+        distances = np.full((self.rows, self.columns), np.inf)
+        column = int(np.clip(np.rint(self.destination[0] / self.cell_size), 0, self.columns - 1))
+        row = int(np.clip(np.rint(self.destination[1] / self.cell_size), 0, self.rows - 1))
+        distances[row, column] = 0.0
+        queue = [(0.0, row, column)]
+        while queue:
+            distance, row, column = heapq.heappop(queue)
+            if distance > distances[row, column]:
+                continue
+            for dy, dx in NEIGHBOR_STEPS:
+                next_row, next_column = row + dy, column + dx
+                if not (0 <= next_row < self.rows and 0 <= next_column < self.columns):
+                    continue
+                if self.blocked[next_row, next_column]:
+                    continue
+                next_distance = distance + np.hypot(dx, dy) * self.cell_size
+                if next_distance < distances[next_row, next_column]:
+                    distances[next_row, next_column] = next_distance
+                    heapq.heappush(queue, (next_distance, next_row, next_column))
+        return distances
+
+    def sample(self, positions):
+        """Return the unit direction of the field at each position, interpolated bilinearly."""
+        x = np.clip(positions[:, 0] / self.cell_size, 0, self.columns - 1)
+        y = np.clip(positions[:, 1] / self.cell_size, 0, self.rows - 1)
+        x0 = np.minimum(np.floor(x).astype(np.int64), self.columns - 2)
+        y0 = np.minimum(np.floor(y).astype(np.int64), self.rows - 2)
+        fx = (x - x0)[:, np.newaxis]
+        fy = (y - y0)[:, np.newaxis]
+        directions = (self.directions[y0, x0] * (1 - fx) * (1 - fy) +
+                      self.directions[y0, x0 + 1] * fx * (1 - fy) +
+                      self.directions[y0 + 1, x0] * (1 - fx) * fy +
+                      self.directions[y0 + 1, x0 + 1] * fx * fy)
+        lengths = np.linalg.norm(directions, axis=1, keepdims=True)
+        return np.divide(directions, lengths, out=np.zeros_like(directions), where=lengths > 0)
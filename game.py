@@ -7,13 +7,17 @@ import numpy as np
 from constants import (
     WINDOW_WIDTH, WINDOW_HEIGHT, COLOR_EMPTY, FONT_COLOR, TOUCHDOWN_LINE_COLOR,
     MIDDLE_LINE_COLOR, TOUCHDOWN_LINE_OFFSET, PLAYER_MAX_HEALTH, OPPONENT_MAX_HEALTH,
-    CELL_SIZE, UNIT_RADIUS
+    UNIT_RADIUS, PARALLEL_BACKEND, LOAD_BALANCING, SPATIAL_SORT_INTERVAL
 )
-from unit_data import UnitData
+from unit_data import UnitData, SharedUnitData
 from unit_manager import UnitManager
+from band_workers import BandProcessPool
+from load_balancer import LoadBalancer
 from bullet_manager import BulletManager
-from spatial_grid import SpatialGrid
+from spatial_index import TeamPartitionedIndex
 from collision_detection import check_bullet_collisions
+from combat import score_touchdowns
+from timestep import substep_count
 from opponent import Opponent
 from user_interface import ElixirManager, UnitSelector, ClickDebouncer
 from wall import Wall
@@ -28,12 +32,22 @@ class Game:
 
         self.clock = pygame.time.Clock()
         self.running = True
+        self.frame_count = 0
+        self.active_indices = np.zeros(0, dtype=np.int64)  # Live unit slots gathered once per frame
 
         # Initialize components
-        self.unit_data = UnitData()
-        self.unit_manager = UnitManager(self.unit_data)
+        if PARALLEL_BACKEND == 'processes':
+            self.unit_data = SharedUnitData()
+            self.unit_manager = UnitManager(self.unit_data)
+            self.unit_manager.band_pool = BandProcessPool(
+                self.unit_data, balancer=LoadBalancer() if LOAD_BALANCING else None
+            )
+        else:
+            self.unit_data = UnitData()
+            self.unit_manager = UnitManager(self.unit_data)
         self.bullet_manager = BulletManager()
-        self.spatial_grid = SpatialGrid(CELL_SIZE)
+        self.unit_manager.bullet_manager = self.bullet_manager
+        self.spatial_index = TeamPartitionedIndex()  # One index per team, backend chosen by SPATIAL_INDEX
         self.elixir_manager = ElixirManager()
         self.unit_selector = UnitSelector()
         self.click_debouncer = ClickDebouncer()
@@ -100,60 +114,41 @@ class Game:
                     self.unit_selector.handle_mouse_click(event.pos)
 
     def process_touchdowns(self):
-        """Check if any units have passed the touchdown lines and update health."""
-        opponent_touchdown_y = TOUCHDOWN_LINE_OFFSET
-        player_touchdown_y = WINDOW_HEIGHT - TOUCHDOWN_LINE_OFFSET
-
-        active_indices = np.where(self.unit_data.active)[0]
-        positions = self.unit_data.position[active_indices]
-        teams = self.unit_data.team[active_indices]
-        damages = self.unit_data.damage[active_indices]
-
-        # Player units scoring touchdowns
-        player_units = active_indices[(teams == 1) & (positions[:, 1] <= opponent_touchdown_y)]
-        for idx in player_units:
-            damage = damages[idx]
-            self.opponent_health -= damage
-            self.unit_data.remove_unit(idx)
-
-        # Opponent units scoring touchdowns
-        opponent_units = active_indices[(teams == 2) & (positions[:, 1] >= player_touchdown_y)]
-        for idx in opponent_units:
-            damage = damages[idx]
-            self.player_health -= damage
-            self.unit_data.remove_unit(idx)
-
-    def update_spatial_grid(self):
-        """Update the spatial grid with current unit positions and bullets."""
-        self.spatial_grid.clear()
-        active_indices = np.where(self.unit_data.active)[0]
-        positions = self.unit_data.position[active_indices]
-
-        for idx, pos in zip(active_indices, positions):
-            self.spatial_grid.add_unit(idx, pos)
+        """Check if any units have passed the touchdown lines and update health.
 
-        for bullet in self.bullet_manager.bullets:
-            self.spatial_grid.add_bullet(bullet)
+        Reads the active set gathered at the start of this frame's update;
+        no unit joins or leaves between the two.
+        """
+        damage_to_player, damage_to_opponent = score_touchdowns(self.unit_data, self.active_indices)
+        self.player_health -= damage_to_player
+        self.opponent_health -= damage_to_opponent
 
     def update(self, dt: float):
         """Update game state."""
         self.elixir_manager.update_elixir()
         self.opponent.update()
 
-        # Update Spatial Grid
-        self.update_spatial_grid()
+        # Periodically reorder unit slots so neighbors sit close together in memory
+        self.frame_count += 1
+        if SPATIAL_SORT_INTERVAL and self.frame_count % SPATIAL_SORT_INTERVAL == 0:
+            self.unit_manager.sort_units_spatially()
+
+        # Gather the live units of this frame
+        self.active_indices = np.where(self.unit_data.active)[0]
 
         # Compute Boid Data
-        self.unit_manager.compute_boid_data(self.spatial_grid)
+        self.unit_manager.compute_boid_data()
 
         # Update Units
-        self.unit_manager.update_units(dt, self.spatial_grid)
+        self.unit_manager.update_units(dt)
 
-        # Update Bullets
-        self.bullet_manager.update(dt, self.screen.get_rect(), self.walls)
-
-        # Check for bullet collisions
-        check_bullet_collisions(self.spatial_grid, self.unit_data, self.bullet_manager)
+        # Update bullets and check collisions in substeps short enough that no bullet skips over a unit;
+        # units stand still meanwhile, so their index is built once
+        bullet_substeps = substep_count(dt, self.bullet_manager.max_speed(), UNIT_RADIUS)
+        for substep in range(bullet_substeps):
+            self.bullet_manager.update(dt / bullet_substeps, self.screen.get_rect(), self.unit_manager.obstacles)
+            check_bullet_collisions(self.spatial_index, self.unit_data, self.bullet_manager,
+                                    rebuild=substep == 0)
 
         # Check for touchdowns and other game events
         self.process_touchdowns()
@@ -254,8 +249,9 @@ class Game:
         # Draw bullets
         self.bullet_manager.render(self.screen)
 
-        # Draw walls
+        # Draw walls and obstacles
         self.walls.draw(self.screen)
+        self.unit_manager.obstacles.render(self.screen)
 
         # Draw UI components
         self.elixir_manager.draw(self.screen)
@@ -276,9 +272,16 @@ class Game:
         # Game Over Screen
         self.game_over_screen()
 
+        self.shutdown()
         pygame.quit()
         sys.exit()
 
+    def shutdown(self):
+        """Stop parallel workers and release shared unit data."""
+        self.unit_manager.shutdown()
+        if isinstance(self.unit_data, SharedUnitData):
+            self.unit_data.close()
+
     def game_over_screen(self):
         """Display the game over screen."""
         self.screen.fill(COLOR_EMPTY)
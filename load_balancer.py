@@ -0,0 +1,153 @@
+# load_balancer.py
+
+import numpy as np
+from constants import CELL_SIZE, REBALANCE_INTERVAL, BULLET_LOAD_WEIGHT, LOAD_SMOOTHING
+
+class LoadBalancer:
+    """Moves region boundaries so each parallel worker gets a similar share of the measured load.
+
+    Load is estimated per grid cell from its unit and bullet counts, scaled by
+    how long the region containing the cell actually took to step. Regions
+    are then cut on the cumulative load: horizontal bands for the process
+    backend, recursive bisection into rectangles of cells for the tiled one.
+    """
+
+    def __init__(self, cell_size=CELL_SIZE, interval=REBALANCE_INTERVAL, bullet_weight=BULLET_LOAD_WEIGHT,
+                 smoothing=LOAD_SMOOTHING):
+        self.interval = interval
+        self.bullet_weight = bullet_weight
+        self.smoothing = smoothing
+        self.frame = 0
+        self.cell_size = cell_size
+        self.cell_keys = np.zeros((0, 2), dtype=np.int64)
+        self.cell_loads = np.zeros(0)
+        self.cell_scale = {}  # Smoothed seconds per unit of load, by cell key
+        self.regions = None  # Current regions as pixel rectangles (min_x, max_x, min_y, max_y)
+
+    def due(self):
+        """Count a frame and return True when boundaries should be recomputed."""
+        self.frame += 1
+        return self.frame % self.interval == 0
+
+    def observe(self, unit_positions, bullet_positions):
+        """Measure the load of every occupied cell from its unit and bullet counts."""
+        unit_positions = np.reshape(unit_positions, (-1, 2))
+        bullet_positions = np.reshape(bullet_positions, (-1, 2))
+        cells = np.floor(np.concatenate([unit_positions, bullet_positions]) / self.cell_size).astype(np.int64)
+        weights = np.concatenate([np.ones(len(unit_positions)), np.full(len(bullet_positions), self.bullet_weight)])
+        keys, cell_ids = np.unique(cells, axis=0, return_inverse=True)
+        self.observe_loads(keys.reshape(-1, 2), np.bincount(cell_ids.reshape(-1), weights=weights, minlength=len(keys)))
+
+    def observe_loads(self, cell_keys, cell_loads):
+        """Take per-cell loads measured elsewhere, keeping only the occupied cells."""
+        cell_keys = np.asarray(cell_keys, dtype=np.int64).reshape(-1, 2)
+        cell_loads = np.asarray(cell_loads, dtype=np.float64)
+        occupied = cell_loads > 0
+        self.cell_keys, self.cell_loads = cell_keys[occupied], cell_loads[occupied]
+
+    def cell_regions(self):
+        """Return the index of the current region containing each observed cell's center."""
+        centers = (self.cell_keys + 0.5) * self.cell_size
+        regions = np.full(len(centers), -1)
+        for r, (min_x, max_x, min_y, max_y) in enumerate(self.regions):
+            inside = ((centers[:, 0] >= min_x) & (centers[:, 0] < max_x) &
+                      (centers[:, 1] >= min_y) & (centers[:, 1] < max_y))
+            regions[inside & (regions < 0)] = r
+        return regions
+
+    def record_region_times(self, region_times):
+        """Fold the last measured step time of each current region into the per-cell cost."""
+        if self.regions is None or len(region_times) != len(self.regions) or len(self.cell_loads) == 0:
+            return
+        regions = self.cell_regions()
+        region_loads = np.bincount(regions[regions >= 0], weights=self.cell_loads[regions >= 0],
+                                   minlength=len(self.regions))
+        busy = region_loads > 0
+        if not np.any(busy):
+            return
+        region_cost = np.ones(len(self.regions))
+        region_cost[busy] = np.asarray(region_times)[busy] / region_loads[busy]
+        mean_cost = np.mean(region_cost[busy])
+        if mean_cost <= 0:
+            return
+        region_cost /= mean_cost
+        for cell_key, region in zip(map(tuple, self.cell_keys), regions):
+            if region < 0 or not busy[region]:
+                continue
+            previous = self.cell_scale.get(cell_key, 1.0)
+            self.cell_scale[cell_key] = previous + self.smoothing * (region_cost[region] - previous)
+
+    def weighted_loads(self):
+        """Cell loads scaled by the measured cost of the cells."""
+        scale = np.array([self.cell_scale.get(tuple(key), 1.0) for key in self.cell_keys])
+        return self.cell_loads * scale
+
+    def split_bands(self, num_bands, height):
+        """Cut the field into `num_bands` horizontal bands of equal load and return their y edges.
+
+        Load is treated as uniform inside a row of cells, so edges can fall
+        inside a row. The outer edges are open.
+        """
+        loads = self.weighted_loads()
+        total = loads.sum()
+        if total <= 0:
+            boundaries = np.linspace(0, height, num_bands + 1)
+        else:
+            rows = self.cell_keys[:, 1]
+            first_row = rows.min()
+            row_loads = np.bincount(rows - first_row, weights=loads)
+            cumulative = np.concatenate(([0.0], np.cumsum(row_loads)))
+            row_edges = (first_row + np.arange(len(row_loads) + 1)) * self.cell_size
+            targets = total * np.arange(1, num_bands) / num_bands
+            boundaries = np.concatenate(([0.0], np.interp(targets, cumulative, row_edges), [0.0]))
+        boundaries[0], boundaries[-1] = -np.inf, np.inf
+        self.regions = [(-np.inf, np.inf, top, bottom) for top, bottom in zip(boundaries[:-1], boundaries[1:])]
+        return boundaries
+
+    def split_tiles(self, num_tiles):
+        """Recursively bisect the occupied cells into up to `num_tiles` rectangles of equal load.
+
+        Returns inclusive cell ranges (min_x, max_x, min_y, max_y); ranges on
+        the outside of the occupied area are left open.
+        """
+        if len(self.cell_keys) == 0:
+            self.regions = None
+            return []
+        loads = self.weighted_loads()
+        lower = [int(value) for value in self.cell_keys.min(axis=0)]
+        upper = [int(value) for value in self.cell_keys.max(axis=0)]
+        tiles = []
+        self.bisect(self.cell_keys, loads, (lower[0], upper[0], lower[1], upper[1]), num_tiles, tiles)
+
+        # Open the outer edges so units that wander off the occupied area still have an owner
+        big = np.iinfo(np.int32).max // 2
+        tiles = [(-big if min_x == lower[0] else min_x, big if max_x == upper[0] else max_x,
+                  -big if min_y == lower[1] else min_y, big if max_y == upper[1] else max_y)
+                 for min_x, max_x, min_y, max_y in tiles]
+        self.regions = [(min_x * self.cell_size, (max_x + 1) * self.cell_size,
+                         min_y * self.cell_size, (max_y + 1) * self.cell_size)
+                        for min_x, max_x, min_y, max_y in tiles]
+        return tiles
+
+    def bisect(self, cells, loads, rect, parts, tiles):
+        """Split `rect` along its longer side at the load quantile matching the part counts."""
+        min_x, max_x, min_y, max_y = rect
+        if parts <= 1 or (min_x == max_x and min_y == max_y):
+            tiles.append(rect)
+            return
+        axis = 0 if (max_x - min_x) >= (max_y - min_y) else 1
+        low, high = (min_x, max_x) if axis == 0 else (min_y, max_y)
+        inside = ((cells[:, 0] >= min_x) & (cells[:, 0] <= max_x) &
+                  (cells[:, 1] >= min_y) & (cells[:, 1] <= max_y))
+        line_loads = np.bincount(cells[inside, axis] - low, weights=loads[inside],
+                                 minlength=high - low + 1)
+        left_parts = parts // 2
+        cumulative = np.cumsum(line_loads)
+        split = low + int(np.searchsorted(cumulative, cumulative[-1] * left_parts / parts))
+        split = min(max(split, low), high - 1)
+        if axis == 0:
+            first, second = (min_x, split, min_y, max_y), (split + 1, max_x, min_y, max_y)
+        else:
+            first, second = (min_x, max_x, min_y, split), (min_x, max_x, split + 1, max_y)
+        self.bisect(cells, loads, first, left_parts, tiles)
+        self.bisect(cells, loads, second, parts - left_parts, tiles)
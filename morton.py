@@ -0,0 +1,16 @@
+# morton.py
+
+import numpy as np
+
+def spread_bits(values):
+    """Spread the low 16 bits of each value so a zero bit sits between every pair of bits."""
+    values = values.astype(np.uint64) & np.uint64(0xFFFF)
+    values = (values | (values << np.uint64(8))) & np.uint64(0x00FF00FF)
+    values = (values | (values << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+    values = (values | (values << np.uint64(2))) & np.uint64(0x33333333)
+    values = (values | (values << np.uint64(1))) & np.uint64(0x55555555)
+    return values
+
+def morton_codes(cells):
+    """Interleave the bits of non-negative (x, y) cell coordinates into Z-order codes."""
+    return spread_bits(cells[:, 0]) | (spread_bits(cells[:, 1]) << np.uint64(1))
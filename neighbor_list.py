@@ -0,0 +1,139 @@
+# neighbor_list.py
+
+import numpy as np
+from constants import NEIGHBOR_SKIN
+from spatial_index import TeamPartitionedIndex
+
+class VerletNeighborList:
+    """Same-team pair list built with `radius + skin` and reused until a unit has moved more than `skin / 2`.
+
+    Each listed unit keeps the reference position it was listed at. Units
+    that join or leave the set between rebuilds (spawns, deaths, ghosts
+    entering or leaving a band) are added or dropped in place: survivors
+    keep their pairs under their new rows, and a joining unit is paired by
+    querying its position against the index of the last build and against
+    the other units that joined since. Only displacement triggers a rebuild,
+    or joiners outnumbering half the list, when a rebuild is cheaper.
+    """
+
+    def __init__(self, radius, skin=NEIGHBOR_SKIN, index=None):
+        self.radius = radius
+        self.skin = skin
+        self.index = index if index is not None else TeamPartitionedIndex()
+        self.indices = np.zeros(0, dtype=np.int64)
+        self.reference_positions = np.zeros((0, 2), dtype=np.float32)
+        self.teams = np.zeros(0, dtype=np.int8)
+        self.built_rows = np.zeros(0, dtype=np.int64)  # Current row of each row of the last build, -1 once gone
+        self.joined_rows = np.zeros(0, dtype=np.int64)  # Rows of the units that joined after the last build
+        self.pairs_i = np.zeros(0, dtype=np.int64)
+        self.pairs_j = np.zeros(0, dtype=np.int64)
+        self.builds = 0
+        self.frames = 0
+
+    def needs_rebuild(self, positions):
+        """True when any unit may have closed the skin."""
+        if len(positions) == 0:
+            return False
+        displacement = positions - self.reference_positions
+        max_squared = np.max(np.einsum('ij,ij->i', displacement, displacement))
+        return max_squared > (self.skin / 2) ** 2
+
+    def rebuild(self, indices, positions, teams):
+        """List every unit at its current position and pair them from a fresh index."""
+        self.indices = np.array(indices, copy=True)
+        self.reference_positions = np.array(positions, dtype=np.float32, copy=True)
+        self.teams = np.array(teams, copy=True)
+        self.index.build(self.reference_positions, self.teams, self.indices)
+        self.pairs_i, self.pairs_j = self.index.ally_pairs(self.radius + self.skin)
+        self.built_rows = np.arange(len(self.indices))
+        self.joined_rows = np.zeros(0, dtype=np.int64)
+        self.builds += 1
+
+    def move_rows(self, rows, count):
+        """Move every listed unit to `rows` (-1 drops it) in a list of `count` rows, keeping its pairs."""
+        kept = rows >= 0
+        reference_positions = np.zeros((count, 2), dtype=np.float32)
+        reference_positions[rows[kept]] = self.reference_positions[kept]
+        teams = np.zeros(count, dtype=self.teams.dtype)
+        teams[rows[kept]] = self.teams[kept]
+        self.reference_positions, self.teams = reference_positions, teams
+        paired = kept[self.pairs_i] & kept[self.pairs_j]
+        self.pairs_i, self.pairs_j = rows[self.pairs_i[paired]], rows[self.pairs_j[paired]]
+        built = self.built_rows >= 0
+        self.built_rows[built] = rows[self.built_rows[built]]
+        self.joined_rows = rows[self.joined_rows]
+        self.joined_rows = self.joined_rows[self.joined_rows >= 0]
+
+    def follow(self, indices, positions, teams):
+        """Carry the list over to a changed unit set, listing joining units at their current positions.
+
+        Returns False when a rebuild is cheaper.
+        """
+        order = np.argsort(indices, kind='stable')
+        found = np.clip(np.searchsorted(indices[order], self.indices), 0, max(len(indices) - 1, 0))
+        rows = np.full(len(self.indices), -1, dtype=np.int64)
+        if len(indices):
+            matched = indices[order][found] == self.indices
+            rows[matched] = order[found[matched]]
+        listed = np.zeros(len(indices), dtype=bool)
+        listed[rows[rows >= 0]] = True
+        joining = np.nonzero(~listed)[0]
+        if len(self.joined_rows) + len(joining) > len(indices) // 2:
+            return False
+
+        self.move_rows(rows, len(indices))
+        self.indices = np.array(indices, copy=True)
+        self.reference_positions[joining] = positions[joining]
+        self.teams[joining] = teams[joining]
+        if len(joining) == 0:
+            return True
+
+        reach = self.radius + self.skin
+        joined = np.concatenate([self.joined_rows, joining])
+        recent = TeamPartitionedIndex()
+        recent.build(self.reference_positions[joined], self.teams[joined])
+        parts_i, parts_j = [self.pairs_i], [self.pairs_j]
+        for team in recent.indices:
+            queries = joining[self.teams[joining] == team]
+            # Units of the last build, at the reference positions they were indexed at
+            query_rows, point_rows = self.index.query_team(self.reference_positions[queries], reach, team)
+            point_rows = self.built_rows[point_rows]
+            alive = point_rows >= 0
+            parts_i.append(queries[query_rows[alive]])
+            parts_j.append(point_rows[alive])
+            # Units that joined since, each pair among joining units once
+            query_rows, point_rows = recent.query_team(self.reference_positions[queries], reach, team)
+            query_rows, point_rows = queries[query_rows], joined[point_rows]
+            once = listed[point_rows] | (point_rows > query_rows)
+            parts_i.append(query_rows[once])
+            parts_j.append(point_rows[once])
+        self.pairs_i, self.pairs_j = np.concatenate(parts_i), np.concatenate(parts_j)
+        self.joined_rows = joined
+        return True
+
+    def update(self, indices, positions, teams):
+        """Return cached ally pairs (i, j) as rows into `positions`, rebuilding only when needed.
+
+        Pairs may be up to `radius + skin` apart, so kernels must still apply
+        their own distance cutoffs. A slot always holds a unit of the same
+        team, so a unit keeps its team while it stays listed.
+        """
+        self.frames += 1
+        if not np.array_equal(indices, self.indices) and not self.follow(indices, positions, teams):
+            self.rebuild(indices, positions, teams)
+        elif self.needs_rebuild(positions):
+            self.rebuild(indices, positions, teams)
+        return self.pairs_i, self.pairs_j
+
+    def remap(self, new_slots):
+        """Follow units to new slots after UnitData.sort_spatially so the cached pairs stay usable.
+
+        Units whose slot was freed are dropped; rows follow the new slot order.
+        """
+        new_indices = new_slots[self.indices]
+        kept = np.nonzero(new_indices >= 0)[0]
+        order = kept[np.argsort(new_indices[kept], kind='stable')]
+        rows = np.full(len(self.indices), -1, dtype=np.int64)
+        rows[order] = np.arange(len(order))
+        self.move_rows(rows, len(order))
+        self.indices = new_indices[order]
@@ -0,0 +1,107 @@
+# obstacles.py
+
+import numpy as np
+import pygame
+from constants import WINDOW_WIDTH, WINDOW_HEIGHT, SDF_CELL_SIZE, OBSTACLE_COLOR
+
+class ObstacleField:
+    """Walls and obstacles rasterized into a cached signed-distance field and its gradient.
+
+    The distance to the nearest obstacle surface (negative inside) is stored
+    on a grid of nodes and sampled bilinearly, so a lookup costs the same no
+    matter how many obstacles the map has. Features thinner than the node
+    spacing are only approximated. The field border is not an obstacle;
+    `clamp` keeps units inside it.
+    """
+
+    def __init__(self, rects=(), circles=(), cell_size=SDF_CELL_SIZE):
+        self.cell_size = cell_size
+        self.columns = int(np.ceil(WINDOW_WIDTH / cell_size)) + 1
+        self.rows = int(np.ceil(WINDOW_HEIGHT / cell_size)) + 1
+        self.rects = [tuple(rect) for rect in rects]
+        self.circles = [(tuple(center), radius) for center, radius in circles]
+        self.rebuild()
+
+    def add_rect(self, rect):
+        """Add a rectangular wall (x, y, width, height) and refresh the field."""
+        self.rects.append(tuple(rect))
+        self.rebuild()
+
+    def add_circle(self, center, radius):
+        """Add a round obstacle and refresh the field."""
+        self.circles.append((tuple(center), radius))
+        self.rebuild()
+
+    def rebuild(self):
+        """Rasterize every obstacle into the distance and unit-gradient grids."""
+        ys, xs = np.mgrid[0:self.rows, 0:self.columns] * float(self.cell_size)
+        # With no obstacles every node is as far from one as the field is wide
+        distance = np.full(xs.shape, float(max(WINDOW_WIDTH, WINDOW_HEIGHT)))
+        for x, y, width, height in self.rects:
+            qx = np.abs(xs - (x + width / 2)) - width / 2
+            qy = np.abs(ys - (y + height / 2)) - height / 2
+            outside = np.hypot(np.maximum(qx, 0), np.maximum(qy, 0))
+            inside = np.minimum(np.maximum(qx, qy), 0)
+            distance = np.minimum(distance, outside + inside)
+        for (x, y), radius in self.circles:
+            distance = np.minimum(distance, np.hypot(xs - x, ys - y) - radius)
+        self.distance = distance
+
+        gradient_y, gradient_x = np.gradient(distance, self.cell_size)
+        gradient = np.stack((gradient_x, gradient_y), axis=-1)
+        lengths = np.linalg.norm(gradient, axis=-1, keepdims=True)
+        self.gradient = np.divide(gradient, lengths, out=np.zeros_like(gradient), where=lengths > 0)
+
+    def has_obstacles(self):
+        return bool(self.rects or self.circles)
+
+    def sample(self, positions):
+        """Return the signed distance and the unit direction away from the nearest obstacle at each position."""
+        x = np.clip(positions[:, 0] / self.cell_size, 0, self.columns - 1)
+        y = np.clip(positions[:, 1] / self.cell_size, 0, self.rows - 1)
+        x0 = np.minimum(np.floor(x).astype(np.int64), self.columns - 2)
+        y0 = np.minimum(np.floor(y).astype(np.int64), self.rows - 2)
+        fx, fy = x - x0, y - y0
+        weights = ((1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy)
+        corners = ((y0, x0), (y0, x0 + 1), (y0 + 1, x0), (y0 + 1, x0 + 1))
+        distances = sum(weight * self.distance[corner] for weight, corner in zip(weights, corners))
+        normals = sum(weight[:, np.newaxis] * self.gradient[corner] for weight, corner in zip(weights, corners))
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+        return distances, normals
+
+    def hits(self, positions):
+        """Return which positions lie inside an obstacle."""
+        if len(positions) == 0:
+            return np.zeros(0, dtype=bool)
+        distances, _ = self.sample(positions)
+        return distances <= 0
+
+    def blocked_nodes(self, node_positions, clearance):
+        """Return which of the given grid nodes lie within `clearance` of an obstacle."""
+        shape = node_positions.shape[:-1]
+        distances, _ = self.sample(node_positions.reshape(-1, 2))
+        return (distances < clearance).reshape(shape)
+
+    def repulsion(self, positions, max_speeds, avoid_distance, weight):
+        """Steering that pushes units away from obstacles closer than `avoid_distance`."""
+        distances, normals = self.sample(positions)
+        strength = np.clip(1 - distances / avoid_distance, 0, 1)
+        return normals * (strength * max_speeds * weight)[:, np.newaxis]
+
+    def clamp(self, positions, velocities, radius):
+        """Keep units of `radius` on the field and out of obstacles, dropping velocity into the obstacle."""
+        positions = np.clip(positions, radius, (WINDOW_WIDTH - radius, WINDOW_HEIGHT - radius))
+        distances, normals = self.sample(positions)
+        overlap = np.maximum(radius - distances, 0)[:, np.newaxis]
+        positions = positions + normals * overlap
+        into = np.minimum(np.einsum('ij,ij->i', velocities, normals), 0)[:, np.newaxis]
+        velocities = velocities - normals * into * (overlap > 0)
+        return positions, velocities
+
+    def render(self, screen):
+        """Draw the obstacles."""
+        for rect in self.rects:
+            pygame.draw.rect(screen, OBSTACLE_COLOR, pygame.Rect(rect))
+        for center, radius in self.circles:
+            pygame.draw.circle(screen, OBSTACLE_COLOR, (int(center[0]), int(center[1])), int(radius))
@@ -1,117 +1,441 @@
 # quadtree.py
-import pygame
-from constants import MAX_OBJECTS, MAX_LEVELS, UNIT_RADIUS
+
+import numpy as np
+from constants import (
+    MAX_OBJECTS, MAX_LEVELS, WINDOW_WIDTH, WINDOW_HEIGHT, LOOSE_QUADTREE_LEVELS, LOOSENESS,
+    TEAMS, FAR_FIELD_THETA
+)
+from morton import morton_codes
+from array_utils import expand_ranges
 
 class QuadTree:
-    """QuadTree data structure for spatial partitioning."""
-
-    def __init__(self, level, bounds):
-        self.level = level
-        self.bounds = pygame.Rect(bounds)
-        self.objects = []
-        self.nodes = []
-
-    def clear(self):
-        """Clear the QuadTree."""
-        self.objects = []
-        for node in self.nodes:
-            node.clear()
-        self.nodes = []
-
-    def split(self):
-        """Split the node into four subnodes."""
-        sub_width = self.bounds.width / 2
-        sub_height = self.bounds.height / 2
-        x = self.bounds.x
-        y = self.bounds.y
-
-        self.nodes = [
-            QuadTree(self.level + 1, (x + sub_width, y, sub_width, sub_height)),  # Top-right
-            QuadTree(self.level + 1, (x, y, sub_width, sub_height)),              # Top-left
-            QuadTree(self.level + 1, (x, y + sub_height, sub_width, sub_height)),# Bottom-left
-            QuadTree(self.level + 1, (x + sub_width, y + sub_height, sub_width, sub_height))  # Bottom-right
-        ]
-
-    def get_index(self, unit):
-        """Determine which node the unit belongs to."""
-        index = -1
-        vertical_midpoint = self.bounds.x + (self.bounds.width / 2)
-        horizontal_midpoint = self.bounds.y + (self.bounds.height / 2)
-
-        in_top_quadrant = unit.position[1] < horizontal_midpoint
-        in_bottom_quadrant = unit.position[1] >= horizontal_midpoint
-        in_left_quadrant = unit.position[0] < vertical_midpoint
-        in_right_quadrant = unit.position[0] >= vertical_midpoint
-
-        if in_top_quadrant:
-            if in_left_quadrant:
-                index = 1  # Top-left
-            elif in_right_quadrant:
-                index = 0  # Top-right
-        elif in_bottom_quadrant:
-            if in_left_quadrant:
-                index = 2  # Bottom-left
-            elif in_right_quadrant:
-                index = 3  # Bottom-right
-
-        return index
-
-    def insert(self, unit):
-        """Insert a unit into the QuadTree."""
-        if self.nodes:
-            index = self.get_index(unit)
-            if index != -1:
-                self.nodes[index].insert(unit)
-                return
-
-        self.objects.append(unit)
-
-        if len(self.objects) > MAX_OBJECTS and self.level < MAX_LEVELS:
-            if not self.nodes:
-                self.split()
-
-            i = 0
-            while i < len(self.objects):
-                index = self.get_index(self.objects[i])
-                if index != -1:
-                    self.nodes[index].insert(self.objects.pop(i))
-                else:
-                    i += 1
-
-    def retrieve(self, return_objects, unit):
-        """Retrieve objects that could collide with the given unit."""
-        index = self.get_index(unit)
-        if index != -1 and self.nodes:
-            self.nodes[index].retrieve(return_objects, unit)
-
-        return_objects.extend(self.objects)
-        return return_objects
-
-    def find_node(self, unit):
-        """Find the node where the unit is stored."""
-        index = self.get_index(unit)
-        if index != -1 and self.nodes:
-            return self.nodes[index].find_node(unit)
-        return self
-
-    def query_range(self, range_rect, found=None):
-        """Retrieve all units within a given rectangular range."""
-        if found is None:
-            found = []
-
-        # If the range does not intersect this node's bounds, return
-        if not self.bounds.colliderect(range_rect):
-            return found
-
-        # Check objects at this node
-        for obj in self.objects:
-            if range_rect.collidepoint(float(obj.position[0]), float(obj.position[1])):
-                found.append(obj)
-
-        # If there are subnodes, check them as well
-        if self.nodes:
-            for node in self.nodes:
-                node.query_range(range_rect, found)
-
-        return found
+    """Linear quadtree: points sorted by Morton key, nodes are key ranges.
+
+    Positions are quantized to a 2^max_level grid over a square covering the
+    points and sorted by the Z-order code of their grid cell. A node at depth
+    `level` is then every key sharing its top 2 * level bits, so its points
+    are one contiguous run of the sorted keys found with `np.searchsorted`;
+    no node objects are stored. Queries descend one level at a time for all
+    query rectangles together.
+    """
+
+    def __init__(self, max_level=MAX_LEVELS, leaf_size=MAX_OBJECTS):
+        self.max_level = min(max_level, 16)  # Morton codes hold 16 bits per axis
+        self.leaf_size = leaf_size
+        self.positions = np.zeros((0, 2))
+        self.codes = np.zeros(0, dtype=np.uint64)
+        self.order = np.zeros(0, dtype=np.int64)
+        self.origin = np.zeros(2)
+        self.size = 1.0
+
+    def build(self, positions):
+        """Sort `positions` by Morton key in one vectorized pass."""
+        self.positions = np.asarray(positions, dtype=np.float64)
+        if len(self.positions) == 0:
+            self.codes = np.zeros(0, dtype=np.uint64)
+            self.order = np.zeros(0, dtype=np.int64)
+            return
+        # Per-column reductions; reducing an (n, 2) array along axis 0 is several times slower
+        xs, ys = self.positions[:, 0], self.positions[:, 1]
+        lower, upper = np.array([xs.min(), ys.min()]), np.array([xs.max(), ys.max()])
+        self.origin = lower
+        self.size = max(float(np.max(upper - lower)), 1e-6) * (1 + 1e-9)
+        resolution = 1 << self.max_level
+        # Offsets from the lower corner are non-negative, so truncating them floors them
+        cells = ((self.positions - lower) * (resolution / self.size)).astype(np.int64)
+        np.minimum(cells, resolution - 1, out=cells)
+        codes = morton_codes(cells)
+        # Points sharing a code may come out in any order; a node's run is used as a set
+        self.order = np.argsort(codes)
+        self.codes = codes[self.order]
+
+    def node_ranges(self, prefixes, level):
+        """Return the [start, end) runs of sorted keys under each node prefix at `level`."""
+        shift = np.uint64(2 * (self.max_level - level))
+        starts = np.searchsorted(self.codes, prefixes << shift, side='left')
+        ends = np.searchsorted(self.codes, (prefixes + np.uint64(1)) << shift, side='left')
+        return starts, ends
+
+    def query_rect(self, rects):
+        """Return (query_rows, point_rows) for every built point inside each rect.
+
+        `rects` is an (n, 4) array of (min_x, max_x, min_y, max_y); bounds are
+        inclusive.
+        """
+        rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+        if len(self.positions) == 0 or len(rects) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        # Active (query, node) pairs; a node is its key prefix plus its cell coordinates at its level
+        queries = np.arange(len(rects))
+        prefixes = np.zeros(len(rects), dtype=np.uint64)
+        node_x = np.zeros(len(rects), dtype=np.int64)
+        node_y = np.zeros(len(rects), dtype=np.int64)
+        found_queries, found_starts, found_ends = [], [], []
+
+        for level in range(self.max_level + 1):
+            starts, ends = self.node_ranges(prefixes, level)
+            node_size = self.size / (1 << level)
+            min_x = self.origin[0] + node_x * node_size
+            min_y = self.origin[1] + node_y * node_size
+            query_rects = rects[queries]
+            overlap = ((ends > starts) &
+                       (min_x <= query_rects[:, 1]) & (min_x + node_size >= query_rects[:, 0]) &
+                       (min_y <= query_rects[:, 3]) & (min_y + node_size >= query_rects[:, 2]))
+            inside = ((min_x >= query_rects[:, 0]) & (min_x + node_size <= query_rects[:, 1]) &
+                      (min_y >= query_rects[:, 2]) & (min_y + node_size <= query_rects[:, 3]))
+            small = (ends - starts) <= self.leaf_size
+            done = overlap & (inside | small | (level == self.max_level))
+            found_queries.append(queries[done])
+            found_starts.append(starts[done])
+            found_ends.append(ends[done])
+
+            descend = overlap & ~done
+            if not np.any(descend):
+                break
+            queries, prefixes = queries[descend], prefixes[descend]
+            node_x, node_y = node_x[descend], node_y[descend]
+            # Children in Z order: x takes the low bit of each quadrant, y the high bit
+            quadrant = np.tile(np.arange(4, dtype=np.uint64), len(queries))
+            queries = np.repeat(queries, 4)
+            prefixes = (np.repeat(prefixes, 4) << np.uint64(2)) | quadrant
+            node_x = np.repeat(node_x, 4) * 2 + (quadrant & np.uint64(1)).astype(np.int64)
+            node_y = np.repeat(node_y, 4) * 2 + (quadrant >> np.uint64(1)).astype(np.int64)
+
+        owners, slots = expand_ranges(np.concatenate(found_starts), np.concatenate(found_ends))
+        query_rows = np.concatenate(found_queries)[owners]
+        point_rows = self.order[slots]
+        points, query_rects = self.positions[point_rows], rects[query_rows]
+        keep = ((points[:, 0] >= query_rects[:, 0]) & (points[:, 0] <= query_rects[:, 1]) &
+                (points[:, 1] >= query_rects[:, 2]) & (points[:, 1] <= query_rects[:, 3]))
+        return query_rows[keep], point_rows[keep]
+
+    def query_radius(self, points, radius):
+        """Return (query_rows, point_rows) for every built point closer than `radius` to each query point."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        rects = np.column_stack((points[:, 0] - radius, points[:, 0] + radius,
+                                 points[:, 1] - radius, points[:, 1] + radius))
+        query_rows, point_rows = self.query_rect(rects)
+        diff = points[query_rows] - self.positions[point_rows]
+        close = np.einsum('ij,ij->i', diff, diff) < radius * radius
+        return query_rows[close], point_rows[close]
+
+class FarFieldQuadTree(QuadTree):
+    """Linear quadtree whose nodes also aggregate unit count, position and velocity per team.
+
+    Aggregates are prefix sums over the Morton-sorted points, so the sums of
+    any node are two lookups at the ends of its key run. `query` walks the
+    tree Barnes-Hut style: a node that does not contain the query point and
+    looks smaller than `theta` times its distance to the node's center of
+    mass counts as one pseudo-unit at that center; nearby nodes are opened
+    down to leaves, whose points are summed exactly.
+    """
+
+    def __init__(self, max_level=MAX_LEVELS, leaf_size=MAX_OBJECTS, teams=TEAMS):
+        super().__init__(max_level, leaf_size)
+        self.teams = np.asarray(teams)
+        self.build_aggregates(np.zeros((0, 2)), np.zeros(0, dtype=self.teams.dtype))
+
+    def build(self, positions, velocities=None, teams=None):
+        """Sort the points and prefix-sum their per-team aggregates."""
+        super().build(positions)
+        if velocities is None:
+            velocities = np.zeros_like(self.positions)
+        if teams is None:
+            teams = np.full(len(self.positions), self.teams[0])
+        self.build_aggregates(velocities, teams)
+
+    def build_aggregates(self, velocities, teams):
+        """Prefix-sum count, position and velocity of each team along the sorted keys."""
+        order = self.order
+        columns = np.searchsorted(self.teams, np.asarray(teams)[order])
+        one_hot = np.zeros((len(order), len(self.teams)))
+        one_hot[np.arange(len(order)), columns] = 1
+        self.point_columns = np.zeros(len(order), dtype=np.int64)
+        self.point_columns[order] = columns
+        self.point_velocities = np.asarray(velocities, dtype=np.float64)
+        self.count_prefix = np.concatenate((np.zeros((1, len(self.teams))), np.cumsum(one_hot, axis=0)))
+        self.position_prefix = np.concatenate((
+            np.zeros((1, len(self.teams), 2)),
+            np.cumsum(one_hot[:, :, np.newaxis] * self.positions[order][:, np.newaxis, :], axis=0)
+        ))
+        self.velocity_prefix = np.concatenate((
+            np.zeros((1, len(self.teams), 2)),
+            np.cumsum(one_hot[:, :, np.newaxis] * self.point_velocities[order][:, np.newaxis, :], axis=0)
+        ))
+
+    def node_sums(self, starts, ends):
+        """Return the per-team count, position sum and velocity sum of each [start, end) key run."""
+        return (self.count_prefix[ends] - self.count_prefix[starts],
+                self.position_prefix[ends] - self.position_prefix[starts],
+                self.velocity_prefix[ends] - self.velocity_prefix[starts])
+
+    def query(self, points, radii, theta=FAR_FIELD_THETA, self_rows=None):
+        """Approximate the per-team count, position sum and velocity sum within `radii` of each point.
+
+        Returns arrays of shape (n, teams), (n, teams, 2) and (n, teams, 2)
+        with columns in `self.teams` order. `theta` trades accuracy for
+        speed; 0 sums every point exactly. `self_rows` gives the built point
+        each query stands for (or -1), so a unit does not count itself.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        radii = np.broadcast_to(np.asarray(radii, dtype=np.float64), len(points))
+        team_count = len(self.teams)
+        counts = np.zeros((len(points), team_count))
+        position_sums = np.zeros((len(points), team_count, 2))
+        velocity_sums = np.zeros((len(points), team_count, 2))
+        if len(self.positions) == 0 or len(points) == 0:
+            return counts, position_sums, velocity_sums
+        if self_rows is None:
+            self_rows = np.full(len(points), -1, dtype=np.int64)
+
+        queries = np.arange(len(points))
+        prefixes = np.zeros(len(points), dtype=np.uint64)
+        node_x = np.zeros(len(points), dtype=np.int64)
+        node_y = np.zeros(len(points), dtype=np.int64)
+        leaf_queries, leaf_starts, leaf_ends = [], [], []
+
+        for level in range(self.max_level + 1):
+            starts, ends = self.node_ranges(prefixes, level)
+            node_size = self.size / (1 << level)
+            min_x = self.origin[0] + node_x * node_size
+            min_y = self.origin[1] + node_y * node_size
+            query_points, query_radii = points[queries], radii[queries]
+            # Distance from each query point to the node box
+            gap_x = np.maximum(np.maximum(min_x - query_points[:, 0], query_points[:, 0] - min_x - node_size), 0)
+            gap_y = np.maximum(np.maximum(min_y - query_points[:, 1], query_points[:, 1] - min_y - node_size), 0)
+            near = (ends > starts) & (gap_x * gap_x + gap_y * gap_y < query_radii * query_radii)
+
+            node_counts, node_positions, node_velocities = self.node_sums(starts, ends)
+            totals = np.maximum(node_counts.sum(axis=1), 1)
+            centers = node_positions.sum(axis=1) / totals[:, np.newaxis]
+            center_distances = np.linalg.norm(centers - query_points, axis=1)
+            outside = (gap_x > 0) | (gap_y > 0)
+            accept = near & outside & (node_size < theta * center_distances)
+            # A far node only counts if its center of mass is in range
+            counted = accept & (center_distances < query_radii)
+            np.add.at(counts, queries[counted], node_counts[counted])
+            np.add.at(position_sums, queries[counted], node_positions[counted])
+            np.add.at(velocity_sums, queries[counted], node_velocities[counted])
+
+            opened = near & ~accept
+            leaf = opened & (((ends - starts) <= self.leaf_size) | (level == self.max_level))
+            leaf_queries.append(queries[leaf])
+            leaf_starts.append(starts[leaf])
+            leaf_ends.append(ends[leaf])
+
+            descend = opened & ~leaf
+            if not np.any(descend):
+                break
+            queries, prefixes = queries[descend], prefixes[descend]
+            node_x, node_y = node_x[descend], node_y[descend]
+            quadrant = np.tile(np.arange(4, dtype=np.uint64), len(queries))
+            queries = np.repeat(queries, 4)
+            prefixes = (np.repeat(prefixes, 4) << np.uint64(2)) | quadrant
+            node_x = np.repeat(node_x, 4) * 2 + (quadrant & np.uint64(1)).astype(np.int64)
+            node_y = np.repeat(node_y, 4) * 2 + (quadrant >> np.uint64(1)).astype(np.int64)
+
+        # Points of opened leaves are summed one by one
+        owners, slots = expand_ranges(np.concatenate(leaf_starts), np.concatenate(leaf_ends))
+        query_rows = np.concatenate(leaf_queries)[owners]
+        point_rows = self.order[slots]
+        diff = points[query_rows] - self.positions[point_rows]
+        keep = ((np.einsum('ij,ij->i', diff, diff) < radii[query_rows] ** 2) &
+                (point_rows != self_rows[query_rows]))
+        query_rows, point_rows = query_rows[keep], point_rows[keep]
+        columns = self.point_columns[point_rows]
+        np.add.at(counts, (query_rows, columns), 1)
+        np.add.at(position_sums, (query_rows, columns), self.positions[point_rows])
+        np.add.at(velocity_sums, (query_rows, columns), self.point_velocities[point_rows])
+        return counts, position_sums, velocity_sums
+
+class LooseQuadTree:
+    """Loose quadtree over a fixed field that is updated in place as points move.
+
+    Points live in the leaves of a full tree of `max_level` levels. Every
+    node's bounds are enlarged by `looseness` times its size on each side
+    (and left open along the field border), so a point keeps its leaf until
+    it leaves the leaf's loose bounds. `update` and `relocate` find the
+    points whose leaf code changed with one vectorized comparison and only
+    check those against the loose bounds and move them.
+
+    Points are identified by their row in `positions`; rows not in the
+    tree have no leaf (-1), so callers may use stable ids such as unit slots
+    as rows and leave gaps. Leaves hold their points in fixed-capacity rows
+    of `members`; removals leave holes (-1) that are compacted away when a
+    leaf runs out of room. Per-node point counts on every level let queries
+    skip empty subtrees.
+    """
+
+    def __init__(self, max_level=LOOSE_QUADTREE_LEVELS, looseness=LOOSENESS,
+                 bounds=(0, WINDOW_WIDTH, 0, WINDOW_HEIGHT), leaf_capacity=MAX_OBJECTS):
+        self.max_level = max_level
+        self.looseness = looseness
+        self.bounds = np.array(bounds, dtype=np.float64)
+        self.side = 1 << max_level
+        self.counts = [np.zeros(1 << (2 * level), dtype=np.int64) for level in range(max_level + 1)]
+        self.members = np.full((self.side * self.side, leaf_capacity), -1, dtype=np.int64)
+        self.fill = np.zeros(self.side * self.side, dtype=np.int64)
+        self.positions = np.zeros((0, 2))
+        self.point_leaf = np.zeros(0, dtype=np.int64)
+        self.point_slot = np.zeros(0, dtype=np.int64)
+        self.relocations = 0
+
+    def leaf_of(self, positions):
+        """Return the leaf containing each position, clamped to the field."""
+        min_x, max_x, min_y, max_y = self.bounds
+        # Truncation only differs from floor below zero, where the clamp applies anyway
+        x = ((positions[:, 0] - min_x) * (self.side / (max_x - min_x))).astype(np.int64)
+        y = ((positions[:, 1] - min_y) * (self.side / (max_y - min_y))).astype(np.int64)
+        np.clip(x, 0, self.side - 1, out=x)
+        np.clip(y, 0, self.side - 1, out=y)
+        return y * self.side + x
+
+    def loose_bounds(self, node_x, node_y, level):
+        """Return the loose (min_x, max_x, min_y, max_y) of nodes at `level`, open along the field border."""
+        min_x, max_x, min_y, max_y = self.bounds
+        width = (max_x - min_x) / (1 << level)
+        height = (max_y - min_y) / (1 << level)
+        last = (1 << level) - 1
+        low_x = np.where(node_x == 0, -np.inf, min_x + (node_x - self.looseness) * width)
+        high_x = np.where(node_x == last, np.inf, min_x + (node_x + 1 + self.looseness) * width)
+        low_y = np.where(node_y == 0, -np.inf, min_y + (node_y - self.looseness) * height)
+        high_y = np.where(node_y == last, np.inf, min_y + (node_y + 1 + self.looseness) * height)
+        return low_x, high_x, low_y, high_y
+
+    def reserve(self, count):
+        """Make room for points in rows up to `count`, leaving any new rows out of the tree."""
+        extra = count - len(self.point_leaf)
+        if extra <= 0:
+            return
+        self.positions = np.concatenate([self.positions, np.zeros((extra, 2))])
+        self.point_leaf = np.concatenate([self.point_leaf, np.full(extra, -1, dtype=np.int64)])
+        self.point_slot = np.concatenate([self.point_slot, np.full(extra, -1, dtype=np.int64)])
+
+    def count_points(self, leaves, amount):
+        """Add `amount` to the count of each leaf and of all its ancestors."""
+        x, y = leaves % self.side, leaves // self.side
+        for level in range(self.max_level, -1, -1):
+            np.add.at(self.counts[level], (y << level) + x, amount)
+            x, y = x >> 1, y >> 1
+
+    def compact(self, needed=0):
+        """Close the holes in every leaf, growing the leaf capacity to fit `needed` more points per leaf."""
+        leaf_rows, columns = np.nonzero(self.members >= 0)
+        points = self.members[leaf_rows, columns]
+        self.fill = np.bincount(leaf_rows, minlength=len(self.fill))
+        capacity = self.members.shape[1]
+        while capacity < np.max(self.fill + needed, initial=0):
+            capacity *= 2
+        self.members = np.full((len(self.fill), capacity), -1, dtype=np.int64)
+        slots = np.arange(len(points)) - np.searchsorted(leaf_rows, leaf_rows, side='left')
+        self.members[leaf_rows, slots] = points
+        self.point_slot[points] = slots
+
+    def insert(self, rows, leaves):
+        """Append points to leaves."""
+        if len(rows) == 0:
+            return
+        order = np.argsort(leaves, kind='stable')
+        rows, leaves = rows[order], leaves[order]
+        rank = np.arange(len(rows)) - np.searchsorted(leaves, leaves, side='left')
+        added = np.bincount(leaves, minlength=len(self.fill))
+        if np.any(self.fill + added > self.members.shape[1]):
+            self.compact(added)
+        slots = self.fill[leaves] + rank
+        self.members[leaves, slots] = rows
+        self.fill += added
+        self.point_leaf[rows] = leaves
+        self.point_slot[rows] = slots
+        self.count_points(leaves, 1)
+
+    def remove(self, rows):
+        """Take points out of their leaves, leaving holes."""
+        if len(rows) == 0:
+            return
+        leaves = self.point_leaf[rows]
+        self.members[leaves, self.point_slot[rows]] = -1
+        self.count_points(leaves, -1)
+        self.point_leaf[rows] = -1
+
+    def build(self, positions):
+        """Insert every row of `positions`, discarding the previous contents."""
+        self.positions = np.asarray(positions, dtype=np.float64)
+        for counts in self.counts:
+            counts[:] = 0
+        self.members[:] = -1
+        self.fill[:] = 0
+        self.point_leaf = np.full(len(self.positions), -1, dtype=np.int64)
+        self.point_slot = np.full(len(self.positions), -1, dtype=np.int64)
+        self.insert(np.arange(len(self.positions)), self.leaf_of(self.positions))
+
+    def update(self, moved_indices, positions):
+        """Relocate the moved points that left their leaf's loose bounds and return how many did.
+
+        `positions` holds the current position of every row of the tree.
+        """
+        self.positions = np.asarray(positions, dtype=np.float64)
+        moved = np.asarray(moved_indices, dtype=np.int64)
+        return self.relocate(moved, self.leaf_of(self.positions[moved]))
+
+    def relocate(self, rows, leaves):
+        """Relocate the points in `rows`, now inside `leaves`, that left their leaf's loose bounds.
+
+        `self.positions` must already hold their new positions. Only a point
+        whose leaf changed is checked against the loose bounds, so the rest
+        cost one comparison of leaf codes. Returns the number relocated.
+        """
+        changed = leaves != self.point_leaf[rows]
+        moved = rows[changed]
+        leaves = self.point_leaf[moved]
+        low_x, high_x, low_y, high_y = self.loose_bounds(leaves % self.side, leaves // self.side,
+                                                         self.max_level)
+        points = self.positions[moved]
+        outside = ((points[:, 0] < low_x) | (points[:, 0] >= high_x) |
+                   (points[:, 1] < low_y) | (points[:, 1] >= high_y))
+        leaving = moved[outside]
+        self.remove(leaving)
+        self.insert(leaving, self.leaf_of(self.positions[leaving]))
+        self.relocations += len(leaving)
+        return len(leaving)
+
+    def query_rect(self, rects):
+        """Return (query_rows, point_rows) for every point inside each (min_x, max_x, min_y, max_y) rect."""
+        rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+        queries = np.arange(len(rects))
+        node_x = np.zeros(len(rects), dtype=np.int64)
+        node_y = np.zeros(len(rects), dtype=np.int64)
+        for level in range(self.max_level + 1):
+            low_x, high_x, low_y, high_y = self.loose_bounds(node_x, node_y, level)
+            query_rects = rects[queries]
+            keep = ((self.counts[level][(node_y << level) + node_x] > 0) &
+                    (low_x <= query_rects[:, 1]) & (high_x >= query_rects[:, 0]) &
+                    (low_y <= query_rects[:, 3]) & (high_y >= query_rects[:, 2]))
+            queries, node_x, node_y = queries[keep], node_x[keep], node_y[keep]
+            if level == self.max_level or len(queries) == 0:
+                break
+            quadrant = np.tile(np.arange(4), len(queries))
+            queries = np.repeat(queries, 4)
+            node_x = np.repeat(node_x, 4) * 2 + (quadrant & 1)
+            node_y = np.repeat(node_y, 4) * 2 + (quadrant >> 1)
+
+        leaves = node_y * self.side + node_x
+        capacity = self.members.shape[1]
+        owners, slots = expand_ranges(leaves * capacity, leaves * capacity + self.fill[leaves])
+        query_rows, point_rows = queries[owners], self.members.ravel()[slots]
+        live = point_rows >= 0
+        query_rows, point_rows = query_rows[live], point_rows[live]
+        points, query_rects = self.positions[point_rows], rects[query_rows]
+        inside = ((points[:, 0] >= query_rects[:, 0]) & (points[:, 0] <= query_rects[:, 1]) &
+                  (points[:, 1] >= query_rects[:, 2]) & (points[:, 1] <= query_rects[:, 3]))
+        return query_rows[inside], point_rows[inside]
 
+    def query_radius(self, points, radius):
+        """Return (query_rows, point_rows) for every point closer than `radius` to each query point."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        rects = np.column_stack((points[:, 0] - radius, points[:, 0] + radius,
+                                 points[:, 1] - radius, points[:, 1] + radius))
+        query_rows, point_rows = self.query_rect(rects)
+        diff = points[query_rows] - self.positions[point_rows]
+        close = np.einsum('ij,ij->i', diff, diff) < radius * radius
+        return query_rows[close], point_rows[close]
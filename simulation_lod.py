@@ -0,0 +1,138 @@
+# simulation_lod.py
+
+import numpy as np
+from constants import (
+    WINDOW_WIDTH, WINDOW_HEIGHT, LOD_CELL_SIZE, LOD_INTERVAL, LOD_SPARSE_COUNT,
+    SLEEP_SPEED, SLEEP_ACCELERATION, SLEEP_FRAMES, SLEEP_BUMP_DISTANCE
+)
+
+class LodScheduler:
+    """Splits units into a full-rate tier and a low-rate tier that is stepped every `interval` frames.
+
+    Tiers come from unit and bullet occupancy counts on a coarse grid: a unit
+    is low-rate when no enemy unit and no bullet is within its vision reach
+    (measured in whole cells) and its cell holds at most `sparse_count`
+    units. Low-rate units are spread over the frames by slot, so each frame
+    steps about 1/interval of them, and each step integrates all the time the
+    unit skipped.
+
+    Units that stay nearly still and unaccelerated for `SLEEP_FRAMES` steps
+    fall asleep and are not stepped at all, nor summed in the neighbor pair
+    kernels. They wake when an enemy or bullet comes within reach, or when a
+    moving awake ally comes within `SLEEP_BUMP_DISTANCE` on the neighbor
+    pair list; still neighbors push the same as when the unit came to rest.
+    """
+
+    def __init__(self, max_units, cell_size=LOD_CELL_SIZE, interval=LOD_INTERVAL,
+                 sparse_count=LOD_SPARSE_COUNT):
+        self.cell_size = cell_size
+        self.columns = int(np.ceil(WINDOW_WIDTH / cell_size))
+        self.rows = int(np.ceil(WINDOW_HEIGHT / cell_size))
+        self.interval = interval
+        self.sparse_count = sparse_count
+        self.frame = 0
+        self.low_rate = np.zeros(max_units, dtype=bool)
+        self.pending_dt = np.zeros(max_units, dtype=np.float64)  # Time since each unit was last stepped
+        self.asleep = np.zeros(max_units, dtype=bool)
+        self.still_frames = np.zeros(max_units, dtype=np.int32)
+
+    def cell_ids(self, positions):
+        """Return the flat cell id of each position, clamped to the field."""
+        cells = np.floor(np.asarray(positions).reshape(-1, 2) / self.cell_size).astype(np.int64)
+        column = np.clip(cells[:, 0], 0, self.columns - 1)
+        row = np.clip(cells[:, 1], 0, self.rows - 1)
+        return row * self.columns + column
+
+    def occupancy(self, cells):
+        """Count the given cell ids into a (rows, columns) grid."""
+        return np.bincount(cells, minlength=self.rows * self.columns).reshape(self.rows, self.columns)
+
+    def box_sum(self, counts, radius):
+        """Sum every cell's counts over the square of cells within `radius` of it."""
+        padded = np.pad(counts, radius)
+        table = np.pad(np.cumsum(np.cumsum(padded, axis=0), axis=1), ((1, 0), (1, 0)))
+        size = 2 * radius + 1
+        return (table[size:, size:] - table[:-size, size:] -
+                table[size:, :-size] + table[:-size, :-size])
+
+    def assign(self, unit_data, active_indices, bullet_positions, reach):
+        """Recompute the tier of every unit from this frame's unit and bullet positions and wake threatened ones."""
+        self.low_rate[:] = False
+        self.pending_dt[~unit_data.active] = 0
+        self.asleep[~unit_data.active] = False
+        self.still_frames[~unit_data.active] = 0
+        if len(active_indices) == 0:
+            return
+        cells = self.cell_ids(unit_data.position[active_indices])
+        teams = unit_data.team[active_indices]
+        radius = int(np.ceil(reach / self.cell_size))
+        unit_counts = self.occupancy(cells).ravel()
+        bullets_near = self.box_sum(self.occupancy(self.cell_ids(bullet_positions)), radius).ravel()
+        for team in np.unique(teams):
+            enemies_near = self.box_sum(self.occupancy(cells[teams != team]), radius).ravel()
+            calm = (enemies_near == 0) & (bullets_near == 0) & (unit_counts <= self.sparse_count)
+            members = teams == team
+            self.low_rate[active_indices[members]] = calm[cells[members]]
+            threatened = (enemies_near > 0) | (bullets_near > 0)
+            self.wake(active_indices[members][threatened[cells[members]]])
+
+    def wake(self, indices):
+        """Wake those of the given units that are asleep."""
+        indices = indices[self.asleep[indices]]
+        self.asleep[indices] = False
+        self.still_frames[indices] = 0
+
+    def wake_bumped(self, indices, pairs_i, pairs_j, positions, velocities):
+        """Wake sleeping units paired with a moving awake ally closer than `SLEEP_BUMP_DISTANCE`.
+
+        Pairs are rows of `indices`, as from the neighbor list.
+        """
+        asleep = self.asleep[indices]
+        moving = ~asleep & (np.linalg.norm(velocities, axis=1) >= SLEEP_SPEED)
+        diff = positions[pairs_i] - positions[pairs_j]
+        close = np.einsum('ij,ij->i', diff, diff) < SLEEP_BUMP_DISTANCE * SLEEP_BUMP_DISTANCE
+        self.wake(indices[np.concatenate([pairs_i[close & asleep[pairs_i] & moving[pairs_j]],
+                                          pairs_j[close & asleep[pairs_j] & moving[pairs_i]]])])
+
+    def observe(self, indices, old_velocities, new_velocities, step_dt):
+        """Count the steps each stepped unit spent at rest and put the ones that stayed still to sleep."""
+        speeds = np.linalg.norm(new_velocities, axis=1)
+        accelerations = np.linalg.norm(new_velocities - old_velocities, axis=1) / np.maximum(step_dt, 1e-9)
+        still = (speeds < SLEEP_SPEED) & (accelerations < SLEEP_ACCELERATION)
+        self.still_frames[indices] = np.where(still, self.still_frames[indices] + 1, 0)
+        falling = still & (self.still_frames[indices] >= SLEEP_FRAMES)
+        self.asleep[indices[falling]] = True
+
+    def schedule(self, active_indices, dt):
+        """Advance the frame and pick the units to step.
+
+        Returns the rows of `active_indices` stepped at full rate, the rows of
+        low-rate units due this frame, and the time step of each unit in both
+        groups (full rate first). Sleeping units are in neither group.
+        """
+        self.frame += 1
+        self.pending_dt[active_indices] += dt
+        sleeping = self.asleep[active_indices]
+        self.pending_dt[active_indices[sleeping]] = 0  # Nothing to catch up on after resting
+        low = self.low_rate[active_indices] & ~sleeping
+        due = low & ((active_indices + self.frame) % self.interval == 0)
+        full_rows = np.nonzero(~low & ~sleeping)[0]
+        due_rows = np.nonzero(due)[0]
+        stepped = active_indices[np.concatenate((full_rows, due_rows))]
+        step_dt = self.pending_dt[stepped]
+        self.pending_dt[stepped] = 0
+        return full_rows, due_rows, step_dt
+
+    def release(self, indices):
+        """Hand units over to another stepper, dropping their pending time and sleep state."""
+        self.pending_dt[indices] = 0
+        self.asleep[indices] = False
+        self.still_frames[indices] = 0
+
+    def remap(self, new_slots):
+        """Follow units to new slots after UnitData.sort_spatially."""
+        kept = np.nonzero(new_slots >= 0)[0]
+        for column in (self.low_rate, self.pending_dt, self.asleep, self.still_frames):
+            values = column[kept]
+            column[:] = 0
+            column[new_slots[kept]] = values
@@ -0,0 +1,480 @@
+# spatial_index.py
+
+import numpy as np
+from typing import Protocol, Tuple
+from constants import (
+    SPATIAL_INDEX, SPATIAL_INDEX_CELL_SIZE, MAX_OBJECTS, MAX_LEVELS, MULTIGRID_BASE_CELL_SIZE, MULTIGRID_LEVELS,
+    TEAMS
+)
+from morton import morton_codes
+from array_utils import expand_ranges
+from quadtree import QuadTree, LooseQuadTree
+
+class SpatialIndex(Protocol):
+    """Batched neighbor queries over a set of 2D points.
+
+    Query results are flat index arrays: row k of the result pairs
+    `query_rows[k]` (a row of the query points) with `point_rows[k]` (a row
+    of the positions passed to `build`). `build` may be given a stable,
+    non-negative key per row (such as a unit slot); indexes kept across
+    builds use it to match points between builds, the others ignore it.
+    """
+
+    def build(self, positions: np.ndarray, keys: np.ndarray = None) -> None: ...
+
+    def query_radius(self, points: np.ndarray, radius: float) -> Tuple[np.ndarray, np.ndarray]: ...
+
+    def query_knn(self, points: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]: ...
+
+    def pairs(self, radius: float) -> Tuple[np.ndarray, np.ndarray]: ...
+
+def empty_result():
+    return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+class SpatialIndexBase:
+    """Shared k-nearest and pair enumeration built on `query_radius`."""
+
+    positions = np.zeros((0, 2))
+
+    def pairs(self, radius):
+        """Return (i, j), i < j, for all built points closer than `radius`."""
+        i, j = self.query_radius(self.positions, radius)
+        keep = i < j
+        return i[keep], j[keep]
+
+    def query_knn(self, points, k):
+        """Return the rows and distances of the `k` nearest built points to each query point.
+
+        Runs radius queries, doubling the radius for queries that have not yet
+        found `k` points. Missing neighbors are reported as row -1 and
+        distance inf.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        rows = np.full((len(points), k), -1, dtype=np.int64)
+        distances = np.full((len(points), k), np.inf)
+        count = len(self.positions)
+        if count == 0 or len(points) == 0 or k <= 0:
+            return rows, distances
+        wanted = min(k, count)
+        extent = np.ptp(self.positions, axis=0)
+        area = max(float(extent[0] * extent[1]), 1.0)
+        radius = max(np.sqrt(wanted * area / (np.pi * count)), 1e-3)
+        reach = np.hypot(*extent) + np.max(np.abs(points - self.positions.mean(axis=0)))
+
+        pending = np.arange(len(points))
+        while len(pending):
+            query_rows, point_rows = self.query_radius(points[pending], radius)
+            found = np.bincount(query_rows, minlength=len(pending))
+            done = (found >= wanted) | (radius > reach)
+            keep = done[query_rows]
+            query_rows, point_rows = query_rows[keep], point_rows[keep]
+            diff = points[pending[query_rows]] - self.positions[point_rows]
+            dist = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+
+            order = np.lexsort((dist, query_rows))
+            query_rows, point_rows, dist = query_rows[order], point_rows[order], dist[order]
+            first = np.searchsorted(query_rows, query_rows, side='left')
+            rank = np.arange(len(query_rows)) - first
+            take = rank < k
+            targets = pending[query_rows[take]]
+            rows[targets, rank[take]] = point_rows[take]
+            distances[targets, rank[take]] = dist[take]
+
+            pending = pending[~done]
+            radius *= 2
+        return rows, distances
+
+class GridIndex(SpatialIndexBase):
+    """Uniform grid: points sorted by cell id, queries scan the cells within reach."""
+
+    def __init__(self, cell_size=SPATIAL_INDEX_CELL_SIZE):
+        self.cell_size = cell_size
+        self.positions = np.zeros((0, 2))
+
+    def build(self, positions, keys=None):
+        self.positions = np.asarray(positions, dtype=np.float64)
+        if len(self.positions) == 0:
+            return
+        cells = np.floor(self.positions / self.cell_size).astype(np.int64)
+        self.origin = cells.min(axis=0)
+        cells -= self.origin
+        self.width = int(cells[:, 0].max()) + 1
+        cell_ids = cells[:, 1] * self.width + cells[:, 0]
+        self.order = np.argsort(cell_ids, kind='stable')
+        self.sorted_ids = cell_ids[self.order]
+
+    def query_radius(self, points, radius):
+        points = np.asarray(points, dtype=np.float64)
+        if len(self.positions) == 0 or len(points) == 0:
+            return empty_result()
+        cells = np.floor(points / self.cell_size).astype(np.int64) - self.origin
+        reach = int(np.ceil(radius / self.cell_size))
+        query_parts, point_parts = [], []
+        for dy in range(-reach, reach + 1):
+            for dx in range(-reach, reach + 1):
+                column = cells[:, 0] + dx
+                # Columns outside the built area would alias into another row
+                valid = np.nonzero((column >= 0) & (column < self.width))[0]
+                neighbor_ids = (cells[valid, 1] + dy) * self.width + column[valid]
+                starts = np.searchsorted(self.sorted_ids, neighbor_ids, side='left')
+                ends = np.searchsorted(self.sorted_ids, neighbor_ids, side='right')
+                owners, slots = expand_ranges(starts, ends)
+                query_rows, point_rows = valid[owners], self.order[slots]
+                diff = points[query_rows] - self.positions[point_rows]
+                close = np.einsum('ij,ij->i', diff, diff) < radius * radius
+                query_parts.append(query_rows[close])
+                point_parts.append(point_rows[close])
+        return np.concatenate(query_parts), np.concatenate(point_parts)
+
+class MultiResolutionGrid(SpatialIndexBase):
+    """Stack of uniform grids whose cell size doubles per level, all sharing one sorted key array.
+
+    Points are sorted once by the Morton code of their finest cell. A cell on
+    level `l` is the run of codes sharing everything above the low `2 * l`
+    bits, so every level is read from the same sorted array with
+    `np.searchsorted`. Each query uses the finest level whose cells are at
+    least as large as its radius: separation scans small cells, vision and
+    attack scan large ones, and all of them only look at the 3x3 cells around
+    the query point.
+    """
+
+    def __init__(self, base_cell_size=MULTIGRID_BASE_CELL_SIZE, levels=MULTIGRID_LEVELS):
+        self.base_cell_size = base_cell_size
+        self.levels = levels
+        self.positions = np.zeros((0, 2))
+
+    def build(self, positions, keys=None):
+        self.positions = np.asarray(positions, dtype=np.float64)
+        if len(self.positions) == 0:
+            return
+        self.origin = self.positions.min(axis=0)
+        cells = np.floor((self.positions - self.origin) / self.base_cell_size).astype(np.int64)
+        cells = np.minimum(cells, 0xFFFF)  # Morton codes hold 16 bits per axis
+        self.last_cell = cells.max(axis=0)
+        codes = morton_codes(cells)
+        self.order = np.argsort(codes, kind='stable')
+        self.codes = codes[self.order]
+
+    def level_for(self, radius):
+        """Return the finest level whose cells are at least `radius` wide."""
+        level = int(np.ceil(np.log2(max(radius, 1e-9) / self.base_cell_size)))
+        return min(max(level, 0), self.levels - 1)
+
+    def cell_ranges(self, cells, level):
+        """Return [start, end) runs of sorted points in each level-`level` cell; cells off the grid are empty."""
+        last = self.last_cell >> level
+        valid = np.all((cells >= 0) & (cells <= last), axis=1)
+        starts = np.zeros(len(cells), dtype=np.int64)
+        ends = np.zeros(len(cells), dtype=np.int64)
+        prefixes = morton_codes(cells[valid])
+        shift = np.uint64(2 * level)
+        starts[valid] = np.searchsorted(self.codes, prefixes << shift, side='left')
+        ends[valid] = np.searchsorted(self.codes, (prefixes + np.uint64(1)) << shift, side='left')
+        return starts, ends
+
+    def query_radius(self, points, radius):
+        points = np.asarray(points, dtype=np.float64)
+        if len(self.positions) == 0 or len(points) == 0:
+            return empty_result()
+        level = self.level_for(radius)
+        cell_size = self.base_cell_size * (1 << level)
+        reach = int(np.ceil(radius / cell_size))
+        cells = np.floor((points - self.origin) / cell_size).astype(np.int64)
+        query_parts, point_parts = [], []
+        for dy in range(-reach, reach + 1):
+            for dx in range(-reach, reach + 1):
+                starts, ends = self.cell_ranges(cells + (dx, dy), level)
+                owners, slots = expand_ranges(starts, ends)
+                point_rows = self.order[slots]
+                diff = points[owners] - self.positions[point_rows]
+                close = np.einsum('ij,ij->i', diff, diff) < radius * radius
+                query_parts.append(owners[close])
+                point_parts.append(point_rows[close])
+        return np.concatenate(query_parts), np.concatenate(point_parts)
+
+    def query_rect(self, rects, level):
+        """Return (query_rows, point_rows) for every point inside each (min_x, max_x, min_y, max_y) rect.
+
+        The rects are covered with the cells of `level`; pick the level of
+        the radius the rects were grown by.
+        """
+        rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+        if len(self.positions) == 0 or len(rects) == 0:
+            return empty_result()
+        cell_size = self.base_cell_size * (1 << level)
+        last = self.last_cell >> level
+        low = np.floor((rects[:, [0, 2]] - self.origin) / cell_size)
+        high = np.floor((rects[:, [1, 3]] - self.origin) / cell_size)
+        low = np.clip(low, 0, last + 1).astype(np.int64)
+        high = np.clip(high, -1, last).astype(np.int64)
+        spans = np.maximum(high - low + 1, 0)
+
+        # Enumerate every covered cell of every rect
+        owners, offsets = expand_ranges(np.zeros(len(rects), dtype=np.int64), spans[:, 0] * spans[:, 1])
+        cells = low[owners] + np.column_stack((offsets % np.maximum(spans[owners, 0], 1),
+                                                offsets // np.maximum(spans[owners, 0], 1)))
+        starts, ends = self.cell_ranges(cells, level)
+        cell_owners, slots = expand_ranges(starts, ends)
+        query_rows, point_rows = owners[cell_owners], self.order[slots]
+        points, query_rects = self.positions[point_rows], rects[query_rows]
+        inside = ((points[:, 0] >= query_rects[:, 0]) & (points[:, 0] <= query_rects[:, 1]) &
+                  (points[:, 1] >= query_rects[:, 2]) & (points[:, 1] <= query_rects[:, 3]))
+        return query_rows[inside], point_rows[inside]
+
+class SweepAndPrune(SpatialIndexBase):
+    """Sort-and-sweep broadphase along y, the axis both armies march along.
+
+    Points are kept sorted by y across builds. Each build starts from the
+    previous order, which barely changes between frames, and re-sorts it with
+    NumPy's stable sort. That is timsort, and it runs in near linear time on
+    such almost sorted input. Candidates are the points whose y lies within
+    the radius, found with `np.searchsorted`, and are then filtered on x and
+    distance. Long columns of units moving along y stay cheap.
+    """
+
+    def __init__(self):
+        self.positions = np.zeros((0, 2))
+        self.order = np.zeros(0, dtype=np.int64)
+        self.sorted_y = np.zeros(0)
+
+    def build(self, positions, keys=None):
+        self.positions = np.asarray(positions, dtype=np.float64)
+        count = len(self.positions)
+        order = np.concatenate((self.order[self.order < count], np.arange(len(self.order), count)))
+        y = self.positions[order, 1]
+        self.order = order[np.argsort(y, kind='stable')]
+        self.sorted_y = self.positions[self.order, 1]
+
+    def candidates(self, points, starts, ends, radius):
+        """Filter the sorted runs [starts, ends) per query point on x, then on distance."""
+        owners, slots = expand_ranges(starts, ends)
+        point_rows = self.order[slots]
+        close_x = np.abs(self.positions[point_rows, 0] - points[owners, 0]) < radius
+        owners, point_rows = owners[close_x], point_rows[close_x]
+        diff = points[owners] - self.positions[point_rows]
+        close = np.einsum('ij,ij->i', diff, diff) < radius * radius
+        return owners[close], point_rows[close]
+
+    def query_radius(self, points, radius):
+        points = np.asarray(points, dtype=np.float64)
+        if len(self.positions) == 0 or len(points) == 0:
+            return empty_result()
+        starts = np.searchsorted(self.sorted_y, points[:, 1] - radius, side='left')
+        ends = np.searchsorted(self.sorted_y, points[:, 1] + radius, side='right')
+        return self.candidates(points, starts, ends, radius)
+
+    def pairs(self, radius):
+        """Sweep forward from each point so every overlapping y interval is visited once."""
+        if len(self.positions) == 0:
+            return empty_result()
+        starts = np.arange(1, len(self.order) + 1)
+        ends = np.searchsorted(self.sorted_y, self.sorted_y + radius, side='right')
+        sorted_rows, point_rows = self.candidates(self.positions[self.order], starts, ends, radius)
+        i, j = self.order[sorted_rows], point_rows
+        return np.minimum(i, j), np.maximum(i, j)
+
+class KDTreeIndex(SpatialIndexBase):
+    """KD-tree stored in flat node arrays: each node splits its points in half at the median of its wider axis."""
+
+    def __init__(self, leaf_size=MAX_OBJECTS, max_depth=MAX_LEVELS):
+        self.leaf_size = leaf_size
+        self.max_depth = max_depth
+        self.positions = np.zeros((0, 2))
+
+    def split(self, rows):
+        """Return the two halves of a node's rows, split at the median of their wider axis."""
+        points = self.positions[rows]
+        axis = int(np.argmax(np.ptp(points, axis=0)))
+        half = len(rows) // 2
+        order = np.argpartition(points[:, axis], half)
+        return rows[order[:half]], rows[order[half:]]
+
+    def build(self, positions, keys=None):
+        self.positions = np.asarray(positions, dtype=np.float64)
+        starts, ends, boxes, children = [], [], [], []
+        self.order = np.arange(len(self.positions))
+        if len(self.positions) == 0:
+            self.node_start = self.node_end = np.zeros(0, dtype=np.int64)
+            self.node_box = np.zeros((0, 4))
+            self.children = []
+            return
+
+        stack = [(0, len(self.positions), 0, -1)]
+        while stack:
+            start, end, depth, parent = stack.pop()
+            node = len(starts)
+            rows = self.order[start:end]
+            points = self.positions[rows]
+            starts.append(start)
+            ends.append(end)
+            boxes.append((points[:, 0].min(), points[:, 0].max(), points[:, 1].min(), points[:, 1].max()))
+            children.append([])
+            if parent >= 0:
+                children[parent].append(node)
+            if end - start <= self.leaf_size or depth >= self.max_depth:
+                continue
+            offset = start
+            for child_rows in self.split(rows):
+                self.order[offset:offset + len(child_rows)] = child_rows
+                if len(child_rows):
+                    stack.append((offset, offset + len(child_rows), depth + 1, node))
+                offset += len(child_rows)
+
+        self.node_start = np.array(starts, dtype=np.int64)
+        self.node_end = np.array(ends, dtype=np.int64)
+        self.node_box = np.array(boxes, dtype=np.float64)
+        self.children = children
+
+    def query_radius(self, points, radius):
+        points = np.asarray(points, dtype=np.float64)
+        if len(self.positions) == 0 or len(points) == 0:
+            return empty_result()
+        query_parts, point_parts = [], []
+        stack = [(0, np.arange(len(points)))]
+        while stack:
+            node, rows = stack.pop()
+            min_x, max_x, min_y, max_y = self.node_box[node]
+            gap_x = np.maximum(np.maximum(min_x - points[rows, 0], points[rows, 0] - max_x), 0)
+            gap_y = np.maximum(np.maximum(min_y - points[rows, 1], points[rows, 1] - max_y), 0)
+            rows = rows[gap_x * gap_x + gap_y * gap_y < radius * radius]
+            if len(rows) == 0:
+                continue
+            if self.children[node]:
+                stack.extend((child, rows) for child in self.children[node])
+                continue
+            members = self.order[self.node_start[node]:self.node_end[node]]
+            diff = points[rows][:, np.newaxis, :] - self.positions[members][np.newaxis, :, :]
+            query_index, member_index = np.nonzero(np.einsum('ijk,ijk->ij', diff, diff) < radius * radius)
+            query_parts.append(rows[query_index])
+            point_parts.append(members[member_index])
+        if not query_parts:
+            return empty_result()
+        return np.concatenate(query_parts), np.concatenate(point_parts)
+
+class QuadTreeIndex(SpatialIndexBase):
+    """Linear quadtree over Morton-sorted points (see quadtree.QuadTree)."""
+
+    def __init__(self, leaf_size=MAX_OBJECTS, max_depth=MAX_LEVELS):
+        self.tree = QuadTree(max_depth, leaf_size)
+        self.positions = np.zeros((0, 2))
+
+    def build(self, positions, keys=None):
+        self.tree.build(positions)
+        self.positions = self.tree.positions
+
+    def query_radius(self, points, radius):
+        if len(self.positions) == 0 or len(points) == 0:
+            return empty_result()
+        return self.tree.query_radius(points, radius)
+
+class LooseQuadTreeIndex(SpatialIndexBase):
+    """Loose quadtree kept across builds (see quadtree.LooseQuadTree).
+
+    Tree points are keyed by the `keys` given to `build` (the row number
+    when none are given), so a unit keeps its place in the tree across
+    builds whatever its row. Keys that disappeared are removed and new keys
+    inserted; the rest are relocated by comparing their leaf codes with the
+    ones stored in the tree, so only points that crossed a leaf edge are
+    checked against the loose bounds. With an unchanged key set the build
+    is that comparison plus writing the positions.
+    """
+
+    def __init__(self):
+        self.tree = LooseQuadTree()
+        self.positions = np.zeros((0, 2))
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.key_rows = np.zeros(0, dtype=np.int64)  # Row of each key in the last build
+
+    def build(self, positions, keys=None):
+        positions = np.asarray(positions, dtype=np.float64)
+        keys = np.arange(len(positions)) if keys is None else np.asarray(keys, dtype=np.int64)
+        tree = self.tree
+        tree.reserve(int(keys.max(initial=-1)) + 1)
+        if len(self.key_rows) < len(tree.point_leaf):
+            self.key_rows = np.resize(self.key_rows, len(tree.point_leaf))
+
+        for axis in range(2):
+            tree.positions[keys, axis] = positions[:, axis]
+        leaves = tree.leaf_of(positions)
+        if np.array_equal(keys, self.keys):
+            # Same points in the same rows: only their leaves can change
+            tree.relocate(keys, leaves)
+            self.positions = positions
+            return
+        current = np.zeros(len(tree.point_leaf), dtype=bool)
+        current[keys] = True
+        tree.remove(self.keys[~current[self.keys]])
+        listed = tree.point_leaf[keys] >= 0
+        tree.relocate(keys[listed], leaves[listed])
+        tree.insert(keys[~listed], leaves[~listed])
+
+        self.keys = keys
+        self.key_rows[keys] = np.arange(len(keys))
+        self.positions = positions
+
+    def query_radius(self, points, radius):
+        if len(self.positions) == 0 or len(points) == 0:
+            return empty_result()
+        query_rows, point_keys = self.tree.query_radius(points, radius)
+        return query_rows, self.key_rows[point_keys]
+
+SPATIAL_INDEX_TYPES = {
+    'grid': GridIndex,
+    'multigrid': MultiResolutionGrid,
+    'sweep': SweepAndPrune,
+    'quadtree': QuadTreeIndex,
+    'loose_quadtree': LooseQuadTreeIndex,
+    'kdtree': KDTreeIndex
+}
+
+def create_spatial_index(kind=SPATIAL_INDEX):
+    """Create the spatial index named by `kind`, one of the keys of SPATIAL_INDEX_TYPES."""
+    if kind not in SPATIAL_INDEX_TYPES:
+        raise ValueError(f"Unknown spatial index '{kind}', expected one of {sorted(SPATIAL_INDEX_TYPES)}")
+    return SPATIAL_INDEX_TYPES[kind]()
+
+class TeamPartitionedIndex:
+    """One spatial index per team, so ally and enemy queries never scan, or mask out, the other side.
+
+    Results use rows of the arrays passed to `build`, like SpatialIndex.
+    """
+
+    def __init__(self, kind=SPATIAL_INDEX, teams=TEAMS):
+        self.indices = {team: create_spatial_index(kind) for team in teams}
+        self.rows = {team: np.zeros(0, dtype=np.int64) for team in teams}
+
+    def build(self, positions, teams, keys=None):
+        """Index each team's rows of `positions` separately, passing on their `keys` if given."""
+        for team, index in self.indices.items():
+            self.rows[team] = np.nonzero(teams == team)[0]
+            index.build(positions[self.rows[team]], None if keys is None else keys[self.rows[team]])
+
+    def query_team(self, points, radius, team):
+        """Return (query_rows, point_rows) for points of `team` closer than `radius` to each query point."""
+        if len(self.rows[team]) == 0 or len(points) == 0:
+            return empty_result()
+        query_rows, point_rows = self.indices[team].query_radius(points, radius)
+        return query_rows, self.rows[team][point_rows]
+
+    def query_enemies(self, points, point_teams, radius):
+        """Return (query_rows, point_rows) pairing each query point with nearby points of the other teams."""
+        query_parts, point_parts = [], []
+        for team in self.indices:
+            queries = np.nonzero(point_teams != team)[0]
+            query_rows, point_rows = self.query_team(points[queries], radius, team)
+            query_parts.append(queries[query_rows])
+            point_parts.append(point_rows)
+        return np.concatenate(query_parts), np.concatenate(point_parts)
+
+    def ally_pairs(self, radius):
+        """Return (i, j), i < j, for every pair of same-team points closer than `radius`."""
+        parts_i, parts_j = [], []
+        for team, index in self.indices.items():
+            if len(self.rows[team]) == 0:
+                continue
+            i, j = index.pairs(radius)
+            parts_i.append(self.rows[team][i])
+            parts_j.append(self.rows[team][j])
+        if not parts_i:
+            return empty_result()
+        return np.concatenate(parts_i), np.concatenate(parts_j)
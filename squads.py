@@ -0,0 +1,98 @@
+# squads.py
+
+import numpy as np
+from constants import SQUAD_FORMATION_GAIN, SQUAD_ENGAGE_MARGIN
+
+class SquadManager:
+    """Formations of units spawned together, stepped as one agent at their centroid.
+
+    Each member keeps its slot offset from the centroid in
+    `unit_data.formation_offset` and its squad id in `unit_data.squad` (-1
+    for free units), so both follow the unit through slot reorders. A squad
+    is intact while it has lost no member and no enemy is within the vision
+    of any member; otherwise its members are detached into individual boids
+    for good.
+    """
+
+    def __init__(self, max_squads):
+        self.alive = np.zeros(max_squads, dtype=bool)
+        self.size = np.zeros(max_squads, dtype=np.int32)  # Members at formation
+        self.position = np.zeros((max_squads, 2), dtype=np.float32)  # Centroid
+        self.velocity = np.zeros((max_squads, 2), dtype=np.float32)  # Velocity of the squad as an agent
+        self.available_ids = list(range(max_squads - 1, -1, -1))
+
+    def form(self, unit_data, indices):
+        """Group the given units into a new squad around their centroid and return its id."""
+        if not self.available_ids:
+            return -1
+        squad = self.available_ids.pop()
+        positions = unit_data.position[indices]
+        centroid = positions.mean(axis=0)
+        unit_data.squad[indices] = squad
+        unit_data.formation_offset[indices] = positions - centroid
+        self.alive[squad] = True
+        self.size[squad] = len(indices)
+        self.position[squad] = centroid
+        self.velocity[squad] = unit_data.velocity[indices].mean(axis=0)
+        return squad
+
+    def disband(self, unit_data, squads):
+        """Detach every member of the given squads into an individual boid."""
+        squads = np.asarray(squads, dtype=np.int64)
+        if len(squads) == 0:
+            return
+        members = np.nonzero(np.isin(unit_data.squad, squads))[0]
+        unit_data.squad[members] = -1
+        self.alive[squads] = False
+        self.available_ids.extend(int(squad) for squad in squads)
+
+    def members(self, unit_data, active_indices):
+        """Return the rows of `active_indices` that belong to an intact squad and their squad ids."""
+        squads = unit_data.squad[active_indices]
+        rows = np.nonzero(squads >= 0)[0]
+        return rows, squads[rows].astype(np.int64)
+
+    def refresh(self, unit_data, active_indices, spatial_index):
+        """Update every squad's centroid from its members and disband the squads that lost members or sighted an enemy.
+
+        `spatial_index` is a TeamPartitionedIndex built over the positions of
+        `active_indices`. Returns the rows and squad ids of the members of
+        the squads that stay intact.
+        """
+        rows, squads = self.members(unit_data, active_indices)
+        count = len(self.alive)
+        members = np.bincount(squads, minlength=count)
+        # Slots freed by dead units keep no squad id, so a casualty shows up as a short squad
+        casualties = np.nonzero(self.alive & (members < self.size))[0]
+
+        live = np.nonzero(members > 0)[0]
+        positions = unit_data.position[active_indices[rows]].astype(np.float64)
+        for axis in range(2):
+            self.position[live, axis] = (np.bincount(squads, positions[:, axis], count)[live] /
+                                         members[live])
+
+        # A squad engages once an enemy is within any member's vision of any member
+        reach = np.zeros(count)
+        spread = np.linalg.norm(unit_data.formation_offset[active_indices[rows]], axis=1)
+        np.maximum.at(reach, squads, unit_data.vision_range[active_indices[rows]] + spread)
+        reach[live] += SQUAD_ENGAGE_MARGIN
+        engaged = np.zeros(0, dtype=np.int64)
+        if len(live):
+            teams = np.zeros(count, dtype=unit_data.team.dtype)
+            teams[squads] = unit_data.team[active_indices[rows]]
+            query_rows, enemy_rows = spatial_index.query_enemies(
+                self.position[live], teams[live], float(reach[live].max())
+            )
+            distances = np.linalg.norm(
+                unit_data.position[active_indices[enemy_rows]] - self.position[live[query_rows]], axis=1
+            )
+            engaged = np.unique(live[query_rows[distances < reach[live[query_rows]]]])
+
+        self.disband(unit_data, np.union1d(casualties, engaged))
+        return self.members(unit_data, active_indices)
+
+    def formation_forces(self, unit_data, indices, squads, squad_velocities, velocities):
+        """Steering that makes members match their squad's velocity while closing on their formation slot."""
+        slots = self.position[squads] + unit_data.formation_offset[indices]
+        desired = squad_velocities[squads] + (slots - unit_data.position[indices]) * SQUAD_FORMATION_GAIN
+        return desired - velocities
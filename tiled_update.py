@@ -0,0 +1,111 @@
+# tiled_update.py
+
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from constants import FORCE_WORKERS, TILE_CELLS, TILES_PER_WORKER, SEPARATION_DISTANCE
+from boid_behaviors import compute_region_forces
+from spatial_index import MultiResolutionGrid
+
+class TiledForceExecutor:
+    """Splits the board into tiles of grid cells and computes forces per tile on a thread pool.
+
+    Each tile reads every unit within the largest vision range of its owned
+    units, found on the matching level of a multi-resolution grid, so ranged
+    units see enemies further than one cell away. With one worker the tiles
+    run inline; the thread pool is opt-in, as NumPy releases the GIL only in
+    parts of the tile kernels and threads only gain at large unit counts on
+    many cores.
+    """
+
+    def __init__(self, cell_size, tile_cells=TILE_CELLS, workers=FORCE_WORKERS, balancer=None):
+        self.cell_size = cell_size
+        self.tile_cells = tile_cells
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        self.balancer = balancer
+        self.balanced_tiles = None  # Cell ranges from the load balancer, replacing fixed tiles
+        self.tile_times = []  # Seconds spent in each tile during the last step
+        self.grid = MultiResolutionGrid()
+
+    def rebalance(self, unit_positions, bullet_positions):
+        """Periodically let the load balancer redraw the tiles from the unit and bullet occupancy."""
+        if self.balancer is None or not self.balancer.due():
+            return
+        self.balancer.observe(unit_positions, bullet_positions)
+        if self.balanced_tiles is not None:
+            self.balancer.record_region_times(self.tile_times)
+        self.balanced_tiles = self.balancer.split_tiles(self.workers * TILES_PER_WORKER) or None
+
+    def build_tiles(self, cells):
+        """Group units by tile and return each tile's rows and inclusive cell bounds."""
+        if self.balanced_tiles is not None:
+            tiles = []
+            for min_x, max_x, min_y, max_y in self.balanced_tiles:
+                inside = ((cells[:, 0] >= min_x) & (cells[:, 0] <= max_x) &
+                          (cells[:, 1] >= min_y) & (cells[:, 1] <= max_y))
+                tiles.append((np.nonzero(inside)[0], (min_x, max_x, min_y, max_y)))
+            return tiles
+
+        tile_coords = cells // self.tile_cells
+        tile_keys, tile_ids = np.unique(tile_coords, axis=0, return_inverse=True)
+        tile_ids = tile_ids.reshape(-1)
+        order = np.argsort(tile_ids, kind='stable')
+        bounds = np.searchsorted(tile_ids[order], np.arange(len(tile_keys) + 1))
+
+        tiles = []
+        for t, (tx, ty) in enumerate(tile_keys):
+            rows = order[bounds[t]:bounds[t + 1]]
+            bounds_cells = (tx * self.tile_cells, (tx + 1) * self.tile_cells - 1,
+                            ty * self.tile_cells, (ty + 1) * self.tile_cells - 1)
+            tiles.append((rows, bounds_cells))
+        return tiles
+
+    def compute_tile(self, owned, tile, units, dt):
+        """Compute forces for one tile against every unit within reach of it and time it."""
+        start = time.perf_counter()
+        min_x, max_x, min_y, max_y = tile
+        reach = max(float(np.max(units['vision_range'][owned], initial=0)), SEPARATION_DISTANCE)
+        rect = (min_x * self.cell_size - reach, (max_x + 1) * self.cell_size + reach,
+                min_y * self.cell_size - reach, (max_y + 1) * self.cell_size + reach)
+        _, candidates = self.grid.query_rect(rect, self.grid.level_for(reach))
+        candidates = np.sort(candidates)
+        return compute_region_forces(owned, candidates, units, dt), time.perf_counter() - start
+
+    def compute_forces(self, units, dt, owned=None):
+        """Compute summed steering forces and pursuit targets for the owned units in `units`.
+
+        `owned` defaults to every unit; the other units are still read as
+        neighbors. Tiles own disjoint sets of units, so each tile's results are
+        scattered into their own rows of the output arrays without any locking.
+        """
+        if owned is None:
+            owned = np.arange(len(units['position']))
+        count = len(owned)
+        forces = np.zeros((count, 2), dtype=np.float32)
+        targets = units['target'][owned]
+        if count == 0:
+            return forces, targets
+
+        cells = np.floor(units['position'][owned] / self.cell_size).astype(np.int32)
+        tiles = self.build_tiles(cells)
+        self.grid.build(units['position'])
+        if self.executor is None:
+            results = [self.compute_tile(owned[rows], tile, units, dt) for rows, tile in tiles]
+        else:
+            futures = [self.executor.submit(self.compute_tile, owned[rows], tile, units, dt)
+                       for rows, tile in tiles]
+            results = [future.result() for future in futures]
+
+        self.tile_times = [elapsed for _, elapsed in results]
+        for (rows, _), (tile_result, _) in zip(tiles, results):
+            tile_forces, tile_targets = tile_result
+            forces[rows] = tile_forces
+            targets[rows] = tile_targets
+        return forces, targets
+
+    def shutdown(self):
+        """Stop the worker threads."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
@@ -0,0 +1,16 @@
+# timestep.py
+
+import numpy as np
+from constants import COURANT_NUMBER, MAX_SUBSTEPS
+
+def substep_count(dt, max_speed, length, courant=COURANT_NUMBER, max_substeps=MAX_SUBSTEPS):
+    """Return how many equal substeps keep the fastest mover within `courant * length` per substep.
+
+    A CFL-style limit: a frame of `dt` seconds is split so nothing moving at
+    `max_speed` travels further than a fraction of the shortest length the
+    subsystem resolves. Capped at `max_substeps` so a long stall cannot
+    snowball into an even longer frame.
+    """
+    if dt <= 0 or max_speed <= 0:
+        return 1
+    return int(min(max(np.ceil(max_speed * dt / (courant * length)), 1), max_substeps))
@@ -1,34 +1,55 @@
 # unit_data.py
 
 import numpy as np
-from constants import MAX_UNITS
+from multiprocessing import shared_memory
+from constants import MAX_UNITS, TEAMS
+from morton import morton_codes
+
+def team_blocks(units_per_team, teams=TEAMS):
+    """Lay out one contiguous block of `units_per_team` slots per team."""
+    return {team: slice(i * units_per_team, (i + 1) * units_per_team) for i, team in enumerate(teams)}
 
 class UnitData:
-    """Struct of Arrays to store unit data."""
+    """Struct of Arrays to store unit data.
+
+    Each team's units live in their own contiguous block of slots, so a team's
+    rows can be read without building a team mask. Every block holds
+    MAX_UNITS slots, so any one team can still field the whole unit limit;
+    the limit itself applies to the live units of all teams together.
+    """
 
     def __init__(self):
-        self.max_units = MAX_UNITS
-        self.active = np.zeros(self.max_units, dtype=bool)
-        self.team = np.zeros(self.max_units, dtype=np.int8)  # 1 or 2
-        self.position = np.zeros((self.max_units, 2), dtype=np.float32)
-        self.velocity = np.zeros((self.max_units, 2), dtype=np.float32)
-        self.health = np.zeros(self.max_units, dtype=np.float32)
-        self.damage = np.zeros(self.max_units, dtype=np.float32)
-        self.speed = np.zeros(self.max_units, dtype=np.float32)
-        self.attack_range = np.zeros(self.max_units, dtype=np.float32)
-        self.vision_range = np.zeros(self.max_units, dtype=np.float32)
-        self.cooldown = np.zeros(self.max_units, dtype=np.float32)
-        self.attack_speed = np.zeros(self.max_units, dtype=np.float32)
-        self.is_ranged = np.zeros(self.max_units, dtype=bool)
-        self.color = np.zeros((self.max_units, 3), dtype=np.uint8)
-        self.radius = np.zeros(self.max_units, dtype=np.float32)
-        self.available_indices = list(range(self.max_units))
+        self.max_units = MAX_UNITS * len(TEAMS)
+        self.unit_count = 0  # Live units over all teams
+        self.column_names = []
+        self.active = self.allocate('active', (), bool)
+        self.team = self.allocate('team', (), np.int8)  # 1 or 2
+        self.position = self.allocate('position', (2,), np.float32)
+        self.velocity = self.allocate('velocity', (2,), np.float32)
+        self.health = self.allocate('health', (), np.float32)
+        self.damage = self.allocate('damage', (), np.float32)
+        self.speed = self.allocate('speed', (), np.float32)
+        self.attack_range = self.allocate('attack_range', (), np.float32)
+        self.vision_range = self.allocate('vision_range', (), np.float32)
+        self.cooldown = self.allocate('cooldown', (), np.float32)
+        self.attack_speed = self.allocate('attack_speed', (), np.float32)
+        self.is_ranged = self.allocate('is_ranged', (), bool)
+        self.color = self.allocate('color', (3,), np.uint8)
+        self.radius = self.allocate('radius', (), np.float32)
+        self.squad = self.allocate('squad', (), np.int32)  # Squad id, -1 for units moving on their own
+        self.formation_offset = self.allocate('formation_offset', (2,), np.float32)  # Slot offset from the squad centroid
+        self.target = self.allocate('target', (), np.int32)  # Slot of the enemy being chased, -1 for none
+        self.team_blocks = team_blocks(MAX_UNITS)
+        self.available_indices = {team: list(range(block.start, block.stop))
+                                  for team, block in self.team_blocks.items()}
 
     def add_unit(self, team, position, velocity, health, damage, speed,
                  attack_range, vision_range, attack_speed, is_ranged, color, radius):
-        if not self.available_indices:
+        free_slots = self.available_indices[int(team)]
+        if not free_slots or self.unit_count >= MAX_UNITS:
             raise Exception("Maximum unit limit reached!")
-        idx = self.available_indices.pop()
+        idx = free_slots.pop()
+        self.unit_count += 1
         self.active[idx] = True
         self.team[idx] = team
         self.position[idx] = position
@@ -43,14 +64,120 @@ class UnitData:
         self.is_ranged[idx] = is_ranged
         self.color[idx] = color
         self.radius[idx] = radius
+        self.squad[idx] = -1
+        self.target[idx] = -1
         return idx
 
+    def allocate(self, name, shape, dtype):
+        """Allocate a zeroed column with one row per unit slot."""
+        self.column_names.append(name)
+        return np.zeros((self.max_units,) + shape, dtype=dtype)
+
+    def team_indices(self, team):
+        """Return the slots of the team's live units, in slot order."""
+        block = self.team_blocks[team]
+        return block.start + np.nonzero(self.active[block])[0]
+
+    def sort_spatially(self, cell_size):
+        """Pack each team's live units into the leading slots of its block in Z-order of their grid cell.
+
+        Every column is permuted in place, so shared buffers stay valid. Free
+        slots are handed out lowest first afterwards, keeping the live units
+        contiguous. Returns an array mapping each old slot to its new slot
+        (-1 for free slots) so holders of unit indices can remap them.
+        """
+        new_slots = np.full(self.max_units, -1, dtype=np.int64)
+        for team, block in self.team_blocks.items():
+            live = self.team_indices(team)
+            cells = np.floor(self.position[live] / cell_size).astype(np.int64)
+            if len(live):
+                cells -= cells.min(axis=0)
+            order = live[np.argsort(morton_codes(cells), kind='stable')]
+            packed = slice(block.start, block.start + len(order))
+            for name in self.column_names:
+                column = getattr(self, name)
+                column[packed] = column[order]
+            self.active[packed.stop:block.stop] = False
+            self.available_indices[team] = list(range(block.stop - 1, packed.stop - 1, -1))
+            new_slots[order] = np.arange(packed.start, packed.stop)
+        # Targets are slots too; targets that died are dropped
+        tracking = self.target >= 0
+        self.target[tracking] = new_slots[self.target[tracking]]
+        return new_slots
+
     def remove_unit(self, idx):
+        self.unit_count -= int(self.active[idx])
         self.active[idx] = False
-        self.available_indices.append(idx)
+        self.available_indices[int(self.team[idx])].append(idx)
+
+    def remove_units(self, indices):
+        """Remove many units at once, returning their slots to their team's free list."""
+        indices = np.asarray(indices, dtype=np.int64)
+        self.unit_count -= int(np.count_nonzero(self.active[indices]))
+        self.active[indices] = False
+        teams = self.team[indices]
+        for team, free_slots in self.available_indices.items():
+            free_slots.extend(indices[teams == team].tolist())
 
     def remove_dead_units(self):
         """Remove units with health <= 0."""
-        dead_indices = np.where((self.active) & (self.health <= 0))[0]
-        for idx in dead_indices:
-            self.remove_unit(idx)
+        self.remove_units(np.where((self.active) & (self.health <= 0))[0])
+
+
+class SharedUnitData(UnitData):
+    """UnitData whose columns live in shared memory so worker processes can map them without copying."""
+
+    def __init__(self):
+        self.shared_blocks = {}
+        self.layout = {}
+        super().__init__()
+        # Horizontal band that owns each unit, -1 until a band pool assigns it
+        self.band = self.allocate('band', (), np.int8)
+        self.band[:] = -1
+
+    def allocate(self, name, shape, dtype):
+        """Allocate a zeroed column in a shared memory block and record it in the layout."""
+        column_shape = (self.max_units,) + shape
+        dtype = np.dtype(dtype)
+        size = max(int(np.prod(column_shape)) * dtype.itemsize, 1)
+        block = shared_memory.SharedMemory(create=True, size=size)
+        column = np.ndarray(column_shape, dtype=dtype, buffer=block.buf)
+        column[...] = 0
+        self.shared_blocks[name] = block
+        self.layout[name] = (block.name, column_shape, dtype.str)
+        self.column_names.append(name)
+        return column
+
+    def add_unit(self, *args, **kwargs):
+        idx = super().add_unit(*args, **kwargs)
+        self.band[idx] = -1
+        return idx
+
+    @classmethod
+    def attach(cls, layout):
+        """Map the columns described by `layout` from another process's SharedUnitData."""
+        unit_data = cls.__new__(cls)
+        unit_data.shared_blocks = {}
+        unit_data.layout = dict(layout)
+        unit_data.column_names = list(layout)
+        unit_data.available_indices = {}
+        for name, (block_name, column_shape, dtype) in layout.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            unit_data.shared_blocks[name] = block
+            setattr(unit_data, name, np.ndarray(column_shape, dtype=dtype, buffer=block.buf))
+        unit_data.max_units = len(unit_data.active)
+        unit_data.team_blocks = team_blocks(unit_data.max_units // len(TEAMS))
+        return unit_data
+
+    def close(self, unlink=True):
+        """Release the shared blocks; the owning process also unlinks them."""
+        for name, block in self.shared_blocks.items():
+            if hasattr(self, name):
+                delattr(self, name)
+            try:
+                block.close()
+            except BufferError:
+                pass  # Views of this column are still alive elsewhere
+            if unlink:
+                block.unlink()
+        self.shared_blocks = {}
@@ -3,125 +3,292 @@
 import numpy as np
 from constants import (
     SEPARATION_WEIGHT, ALIGNMENT_WEIGHT, COHESION_WEIGHT, PURSUIT_WEIGHT,
-    GOAL_WEIGHT, SEPARATION_DISTANCE, RATE_OF_GAIN, DESTINATION1, DESTINATION2, UNIT_RADIUS, WINDOW_HEIGHT, WINDOW_WIDTH
+    GOAL_WEIGHT, SEPARATION_DISTANCE, RATE_OF_GAIN, DESTINATION1, DESTINATION2, UNIT_RADIUS, WINDOW_HEIGHT, WINDOW_WIDTH,
+    CELL_SIZE, FORCE_WORKERS, LOAD_BALANCING, USE_NEIGHBOR_LIST, COHESION_RADIUS,
+    SPATIAL_SORT_CELL_SIZE, OBSTACLE_AVOID_DISTANCE, OBSTACLE_WEIGHT, OBSTACLE_RECTS, OBSTACLE_CIRCLES,
+    SIMULATION_LOD, SQUAD_FORMATION_WEIGHT, FAR_FIELD, RETARGET_INTERVAL
 )
-from boid_behaviors import compute_separation_forces, compute_alignment_and_cohesion, compute_pursuit_forces
+from tiled_update import TiledForceExecutor
+from load_balancer import LoadBalancer
+from neighbor_list import VerletNeighborList
+from cell_aggregates import CellAggregates
+from flow_field import FlowField
+from obstacles import ObstacleField
+from simulation_lod import LodScheduler
+from squads import SquadManager
+from combat import resolve_combat
+from timestep import substep_count
+from spatial_index import TeamPartitionedIndex
+from quadtree import FarFieldQuadTree
+from boid_behaviors import compute_separation_forces_from_pairs, compute_cohesion_from_pairs
 
 class UnitManager:
     """Manages unit updates and behaviors."""
 
-    def __init__(self, unit_data):
+    def __init__(self, unit_data, force_workers=FORCE_WORKERS):
         self.unit_data = unit_data
+        balancer = LoadBalancer() if LOAD_BALANCING and force_workers > 1 else None
+        self.force_executor = TiledForceExecutor(CELL_SIZE, workers=force_workers, balancer=balancer)
+        self.cell_aggregates = CellAggregates(CELL_SIZE)
+        self.band_pool = None  # Set to a BandProcessPool to run the update in worker processes
+        self.bullet_manager = None  # Receives the shots fired during update_units
+        self.neighbor_list = (VerletNeighborList(max(SEPARATION_DISTANCE, COHESION_RADIUS))
+                              if USE_NEIGHBOR_LIST else None)
+        self.flow_fields = {1: FlowField(DESTINATION1), 2: FlowField(DESTINATION2)}
+        self.set_obstacles(ObstacleField(OBSTACLE_RECTS, OBSTACLE_CIRCLES))
+        # Low-rate units only get separation, which comes from the neighbor list
+        self.lod = (LodScheduler(unit_data.max_units)
+                    if SIMULATION_LOD and self.neighbor_list is not None else None)
+        # Intact squads are stepped as one agent; their members only keep formation and separation
+        self.squads = SquadManager(unit_data.max_units)
+        self.squad_index = TeamPartitionedIndex()
+        # Replaces the per-cell alignment and cohesion sums with vision-range estimates
+        self.far_field = FarFieldQuadTree() if FAR_FIELD else None
+        self.retarget_phase = 0  # Picks the slice of units that searches for the nearest enemy
+        self.neighbor_pairs = None  # Rows of the cached neighbor pairs, narrowed by add_neighbor_forces
 
-    def compute_boid_data(self, spatial_grid):
-        """Compute boid data for each cell."""
-        self.cell_boid_data = {}
-        for cell_key, cell_contents in spatial_grid.grid.items():
-            unit_indices = cell_contents.get('units', [])
-            if not unit_indices:
-                continue
-            positions = self.unit_data.position[unit_indices]
-            velocities = self.unit_data.velocity[unit_indices]
-            count = len(unit_indices)
-
-            alignment = np.mean(velocities, axis=0)
-            cohesion_center = np.mean(positions, axis=0)
-
-            self.cell_boid_data[cell_key] = {
-                'alignment': alignment,
-                'cohesion_center': cohesion_center
-            }
-
-    def update_units(self, dt, spatial_grid):
+    def compute_boid_data(self):
+        """Rebuild the per-cell alignment and cohesion sums from this frame's unit state."""
+        active_indices = np.where(self.unit_data.active)[0]
+        self.cell_aggregates.rebuild(self.unit_data.position[active_indices], self.unit_data.velocity[active_indices])
+
+    def cell_boid_data_per_unit(self, positions):
+        """Look up the alignment and cohesion center of each unit's cell."""
+        return self.cell_aggregates.lookup(positions)
+
+    def far_field_data(self, indices, rows):
+        """Estimate the alignment and cohesion center over their vision range of the given rows of `indices`.
+
+        They are the mean velocity and position of the allies in range (the
+        unit's own when it has none); the force kernels read the cohesion
+        center only without the neighbor list. Every unit in `indices` is a
+        source; distant groups are approximated by their quadtree node
+        aggregates.
+        """
+        self.far_field.build(self.unit_data.position[indices], self.unit_data.velocity[indices],
+                             self.unit_data.team[indices])
+        queried = indices[rows]
+        positions = self.unit_data.position[queried]
+        velocities = self.unit_data.velocity[queried]
+        counts, position_sums, velocity_sums = self.far_field.query(
+            positions, self.unit_data.vision_range[queried], self_rows=rows
+        )
+        order = np.arange(len(rows))
+        own = np.searchsorted(self.far_field.teams, self.unit_data.team[queried])
+        allies = counts[order, own][:, np.newaxis]
+        alignment = np.where(allies > 0, velocity_sums[order, own] / np.maximum(allies, 1), velocities)
+        cohesion_center = np.where(allies > 0, position_sums[order, own] / np.maximum(allies, 1), positions)
+        return alignment.astype(np.float32), cohesion_center.astype(np.float32)
+
+    def sort_units_spatially(self):
+        """Reorder unit slots in Z-order of their cell and remap every cached unit index."""
+        new_slots = self.unit_data.sort_spatially(SPATIAL_SORT_CELL_SIZE)
+        if self.neighbor_list is not None:
+            self.neighbor_list.remap(new_slots)
+        if self.lod is not None:
+            self.lod.remap(new_slots)
+        return new_slots
+
+    def gather_units(self, indices, alignment, cohesion_center):
+        """Gather the per-unit arrays read by the force kernels for the given unit slots.
+
+        Each call advances the re-acquisition schedule: a unit is flagged to
+        search for the nearest enemy once every `RETARGET_INTERVAL` calls.
+        """
+        self.retarget_phase = (self.retarget_phase + 1) % RETARGET_INTERVAL
+        return {
+            'index': indices,
+            'position': self.unit_data.position[indices],
+            'velocity': self.unit_data.velocity[indices],
+            'team': self.unit_data.team[indices],
+            'max_speed': self.unit_data.speed[indices] * 5,
+            'vision_range': self.unit_data.vision_range[indices],
+            'target': self.unit_data.target[indices],
+            'retarget': (indices + self.retarget_phase) % RETARGET_INTERVAL == 0,
+            'alignment': alignment,
+            'cohesion_center': cohesion_center
+        }
+
+    def update_neighbor_pairs(self, indices, positions, teams):
+        """Refresh self.neighbor_pairs from the neighbor list, as rows of `indices`."""
+        if self.neighbor_list is not None:
+            self.neighbor_pairs = self.neighbor_list.update(indices, positions, teams)
+
+    def add_neighbor_forces(self, units, full_rows=None, separated_rows=None):
+        """Sum separation and cohesion over self.neighbor_pairs into units['neighbor_forces'].
+
+        Separation alone is also kept in units['separation']. Only pairs
+        touching `full_rows` (every row by default) or `separated_rows` are
+        summed, so units that are not stepped cost nothing: separation is
+        exact for both groups and cohesion for `full_rows`; other rows hold
+        partial sums. self.neighbor_pairs keeps the summed pairs.
+        """
+        if self.neighbor_list is None:
+            return
+        pairs_i, pairs_j = self.neighbor_pairs
+        cohesive = slice(None)
+        if full_rows is not None:
+            full = np.zeros(len(units['position']), dtype=bool)
+            full[full_rows] = True
+            separated = full.copy()
+            if separated_rows is not None:
+                separated[separated_rows] = True
+            touching = separated[pairs_i] | separated[pairs_j]
+            pairs_i, pairs_j = pairs_i[touching], pairs_j[touching]
+            self.neighbor_pairs = (pairs_i, pairs_j)
+            cohesive = full[pairs_i] | full[pairs_j]
+        separation = compute_separation_forces_from_pairs(
+            units['position'], pairs_i, pairs_j, SEPARATION_DISTANCE, SEPARATION_WEIGHT
+        )
+        cohesion = compute_cohesion_from_pairs(
+            units['position'], units['velocity'], pairs_i[cohesive], pairs_j[cohesive],
+            COHESION_RADIUS, COHESION_WEIGHT, units['max_speed']
+        )
+        units['separation'] = separation
+        units['neighbor_forces'] = separation + cohesion
+
+    def bullet_positions(self):
+        """Positions of the live bullets, or none without a bullet store."""
+        if self.bullet_manager is None:
+            return np.zeros((0, 2), dtype=np.float32)
+        return self.bullet_manager.positions
+
+    def update_units(self, dt):
         """Update all units with vectorized boid behaviors."""
         active_indices = np.where(self.unit_data.active)[0]
         positions = self.unit_data.position[active_indices]
-        velocities = self.unit_data.velocity[active_indices]
-        teams = self.unit_data.team[active_indices]
-        max_speeds = self.unit_data.speed[active_indices] * 5
-
-        # Initialize steering forces
-        separation_forces = np.zeros_like(positions)
-        alignment_forces = np.zeros_like(positions)
-        cohesion_forces = np.zeros_like(positions)
-        pursuit_forces = np.zeros_like(positions)
-        goal_forces = np.zeros_like(positions)
-
-        # Prepare unit properties
-        cooldowns = self.unit_data.cooldown[active_indices]
-        attack_speeds = self.unit_data.attack_speed[active_indices]
-        is_ranged = self.unit_data.is_ranged[active_indices]
-        damage = self.unit_data.damage[active_indices]
-        vision_ranges = self.unit_data.vision_range[active_indices]
-        attack_ranges = self.unit_data.attack_range[active_indices]
-        colors = self.unit_data.color[active_indices]
-        radii = self.unit_data.radius[active_indices]
-
-        # Initialize arrays for firing bullets
-        fire_bullet_mask = np.zeros(len(active_indices), dtype=bool)
-        fire_target_positions = np.zeros((len(active_indices), 2), dtype=np.float32)
-
-        # Vectorized boid behaviors and attack logic
-        for cell_key in spatial_grid.grid.keys():
-            # Get units in the current cell and adjacent cells
-            neighbor_cells = spatial_grid.get_adjacent_cells(cell_key) + [cell_key]
-            neighbor_indices = []
-            for n_cell in neighbor_cells:
-                neighbor_indices.extend(spatial_grid.grid.get(n_cell, {}).get('units', []))
-
-            # Map global indices to local indices
-            cell_indices_in_active = np.nonzero(np.isin(active_indices, neighbor_indices))[0]
-            if len(cell_indices_in_active) == 0:
-                continue
-
-            # Get unit data
-            cell_positions = positions[cell_indices_in_active]
-            cell_velocities = velocities[cell_indices_in_active]
-            cell_teams = teams[cell_indices_in_active]
-            cell_max_speeds = max_speeds[cell_indices_in_active]
-            cell_cooldowns = cooldowns[cell_indices_in_active]
-            cell_attack_speeds = attack_speeds[cell_indices_in_active]
-            cell_is_ranged = is_ranged[cell_indices_in_active]
-            cell_damage = damage[cell_indices_in_active]
-            cell_vision_ranges = vision_ranges[cell_indices_in_active]
-            cell_attack_ranges = attack_ranges[cell_indices_in_active]
-
-            # Compute separation forces
-            sep_forces = compute_separation_forces(
-                cell_positions, cell_teams, SEPARATION_DISTANCE, SEPARATION_WEIGHT
-            )
-            separation_forces[cell_indices_in_active] += sep_forces
+        if self.band_pool is not None:
+            # Worker processes update their bands directly in shared memory
+            self.band_pool.rebalance(positions, self.bullet_positions())
+            self.band_pool.step(dt)
+        else:
+            self.force_executor.rebalance(positions, self.bullet_positions())
+            teams = self.unit_data.team[active_indices]
+            self.update_neighbor_pairs(active_indices, positions, teams)
 
-            # Compute alignment and cohesion forces
-            boid_data = self.cell_boid_data.get(cell_key, {})
-            align_forces, coh_forces = compute_alignment_and_cohesion(
-                cell_positions, cell_velocities, boid_data,
-                ALIGNMENT_WEIGHT, COHESION_WEIGHT, cell_max_speeds
-            )
-            alignment_forces[cell_indices_in_active] += align_forces
-            cohesion_forces[cell_indices_in_active] += coh_forces
-
-            # Compute pursuit forces and attack logic
-            pur_forces, fire_mask, target_positions, updated_cooldowns = compute_pursuit_forces(
-                cell_indices_in_active, active_indices, positions, velocities, teams,
-                cell_positions, cell_teams, cell_velocities, cell_max_speeds,
-                cell_cooldowns, cell_attack_speeds, cell_is_ranged, cell_damage,
-                cell_vision_ranges, cell_attack_ranges, PURSUIT_WEIGHT, dt
+            # Units away from combat are stepped every few frames with goal and separation only,
+            # and units at rest are not stepped until something disturbs them
+            if self.lod is not None:
+                reach = float(np.max(self.unit_data.vision_range[active_indices], initial=0))
+                self.lod.assign(self.unit_data, active_indices, self.bullet_positions(), reach)
+                self.lod.wake_bumped(active_indices, *self.neighbor_pairs, positions,
+                                     self.unit_data.velocity[active_indices])
+                full_rows, due_rows, step_dt = self.lod.schedule(active_indices, dt)
+            else:
+                full_rows, due_rows = np.arange(len(active_indices)), np.zeros(0, dtype=np.int64)
+                step_dt = np.full(len(active_indices), dt)
+
+            squad_rows, squad_ids = self.refresh_squads(active_indices, positions, teams)
+            if len(squad_rows):
+                in_squad = np.zeros(len(active_indices), dtype=bool)
+                in_squad[squad_rows] = True
+                step_dt = step_dt[~in_squad[np.concatenate([full_rows, due_rows])]]
+                full_rows, due_rows = full_rows[~in_squad[full_rows]], due_rows[~in_squad[due_rows]]
+                if self.lod is not None:
+                    self.lod.release(active_indices[squad_rows])
+
+            # Alignment and cohesion centers are only looked up for the units stepped at full rate;
+            # every unit stays visible to them as a neighbor, target and source of the sums
+            alignment = np.zeros((len(active_indices), 2), dtype=np.float32)
+            cohesion_center = np.zeros((len(active_indices), 2), dtype=np.float32)
+            if self.far_field is not None:
+                alignment[full_rows], cohesion_center[full_rows] = self.far_field_data(
+                    active_indices, full_rows
+                )
+            else:
+                alignment[full_rows], cohesion_center[full_rows] = self.cell_boid_data_per_unit(
+                    positions[full_rows]
+                )
+            units = self.gather_units(active_indices, alignment, cohesion_center)
+            self.add_neighbor_forces(units, full_rows, np.concatenate([due_rows, squad_rows]))
+
+            # Separation, alignment, cohesion and pursuit per spatial tile
+            boid_forces, targets = self.force_executor.compute_forces(units, dt, full_rows)
+            if len(due_rows):
+                boid_forces = np.concatenate([boid_forces, units['separation'][due_rows]])
+            stepped = np.concatenate([full_rows, due_rows])
+            positions, velocities = self.integrate_substeps(units, stepped, boid_forces, step_dt)
+
+            if self.lod is not None:
+                self.lod.observe(active_indices[stepped], units['velocity'][stepped], velocities, step_dt)
+
+            # Update unit data
+            self.unit_data.position[active_indices[stepped]] = positions
+            self.unit_data.velocity[active_indices[stepped]] = velocities
+            self.unit_data.target[active_indices[full_rows]] = targets
+
+            if len(squad_rows):
+                self.step_squads(units, squad_rows, squad_ids, dt)
+
+        # Cooldowns, melee hits and shots of every unit after movement
+        firing_units_indices, fire_target_positions = resolve_combat(
+            self.unit_data, np.nonzero(self.unit_data.active)[0], dt
+        )
+
+        # Emit the whole volley at once
+        if len(firing_units_indices):
+            self.bullet_manager.add_bullets(
+                positions=self.unit_data.position[firing_units_indices],
+                targets=fire_target_positions,
+                damage=self.unit_data.damage[firing_units_indices],
+                colors=self.unit_data.color[firing_units_indices],
+                teams=self.unit_data.team[firing_units_indices],
+                speed=100.0  # Adjust as needed
             )
-            pursuit_forces[cell_indices_in_active] += pur_forces
-            fire_bullet_mask[cell_indices_in_active] |= fire_mask
-            fire_target_positions[cell_indices_in_active] = target_positions
-            cooldowns[cell_indices_in_active] = updated_cooldowns
 
+    def total_weights(self):
+        """Sum of the steering weights; free units and squad members divide their summed forces by it."""
+        return SEPARATION_WEIGHT + ALIGNMENT_WEIGHT + COHESION_WEIGHT + PURSUIT_WEIGHT + GOAL_WEIGHT
+
+    def integrate(self, positions, velocities, teams, max_speeds, boid_forces, dt):
+        """Add goal steering to the boid forces and advance velocities and positions.
+
+        `dt` is a scalar or a column of per-unit time steps.
+        """
         # Compute goal forces
-        goal_forces = self.compute_goal_forces(positions, teams, max_speeds)
+        goal_forces = self.compute_goal_forces(positions, velocities, teams, max_speeds)
 
         # Update velocities
-        total_forces = (separation_forces + alignment_forces +
-                        cohesion_forces + pursuit_forces + goal_forces)
-        total_weights = (SEPARATION_WEIGHT + ALIGNMENT_WEIGHT +
-                         COHESION_WEIGHT + PURSUIT_WEIGHT + GOAL_WEIGHT)
-        velocities += (total_forces / total_weights) * dt * RATE_OF_GAIN
+        total_weights = self.total_weights()
+        # Obstacle repulsion only acts near obstacles, so it is not diluted by the other weights
+        obstacle_forces = self.obstacles.repulsion(positions, max_speeds, OBSTACLE_AVOID_DISTANCE,
+                                                   OBSTACLE_WEIGHT * total_weights)
+        total_forces = boid_forces + goal_forces + obstacle_forces
+        return self.advance(positions, velocities, max_speeds, total_forces / total_weights, dt)
+
+    def integrate_substeps(self, units, rows, boid_forces, step_dt):
+        """Integrate the given rows of `units`, substepping separation when one step would move units too far.
+
+        The number of substeps follows from the longest step and the fastest
+        unit against the unit radius and separation distance. Pursuit,
+        alignment and cohesion are held for the whole step; separation is
+        recomputed from the cached neighbor pairs at every substep.
+        """
+        positions, velocities = units['position'][rows], units['velocity'][rows]
+        teams, max_speeds = units['team'][rows], units['max_speed'][rows]
+        count = substep_count(float(np.max(step_dt, initial=0)), float(np.max(max_speeds, initial=0)),
+                              min(UNIT_RADIUS, SEPARATION_DISTANCE))
+        if count == 1 or self.neighbor_pairs is None:
+            return self.integrate(positions, velocities, teams, max_speeds, boid_forces, step_dt[:, np.newaxis])
+
+        pairs_i, pairs_j = self.neighbor_pairs
+        held_forces = boid_forces - units['separation'][rows]
+        separation = units['separation'][rows]
+        all_positions = units['position'].copy()
+        substep_dt = (step_dt / count)[:, np.newaxis]
+        for substep in range(count):
+            if substep:
+                separation = compute_separation_forces_from_pairs(
+                    all_positions, pairs_i, pairs_j, SEPARATION_DISTANCE, SEPARATION_WEIGHT
+                )[rows]
+            positions, velocities = self.integrate(positions, velocities, teams, max_speeds,
+                                                   held_forces + separation, substep_dt)
+            all_positions[rows] = positions
+        return positions, velocities
+
+    def advance(self, positions, velocities, max_speeds, accelerations, dt):
+        """Apply the accelerations, limit speeds and move units, keeping them on the field and out of obstacles."""
+        velocities = velocities + accelerations * dt * RATE_OF_GAIN
 
         # Limit speed to max speed
         speeds = np.linalg.norm(velocities, axis=1)
@@ -129,36 +296,70 @@ class UnitManager:
         velocities[speed_mask] = (velocities[speed_mask].T *
                                   (max_speeds[speed_mask] / speeds[speed_mask])).T
 
-        # Update positions
-        positions += velocities * dt
-
-        # Update unit data
-        self.unit_data.position[active_indices] = positions
-        self.unit_data.velocity[active_indices] = velocities
-        self.unit_data.cooldown[active_indices] = cooldowns
-
-        # Handle firing bullets
-        firing_units_indices = active_indices[fire_bullet_mask]
-        for idx, target_pos in zip(firing_units_indices, fire_target_positions[fire_bullet_mask]):
-            self.bullet_manager.add_bullet(
-                position=self.unit_data.position[idx].copy(),
-                velocity=(target_pos - self.unit_data.position[idx]).copy(),
-                damage=self.unit_data.damage[idx],
-                color=self.unit_data.color[idx],
-                team=self.unit_data.team[idx],
-                speed=100.0  # Adjust as needed
-            )
+        # Update positions, keeping units on the field and out of obstacles
+        positions = positions + velocities * dt
+        positions, velocities = self.obstacles.clamp(positions, velocities, UNIT_RADIUS)
+        return positions.astype(np.float32), velocities.astype(np.float32)
+
+    def refresh_squads(self, active_indices, positions, teams):
+        """Update squad centroids, disband broken or engaged squads and return the intact members' rows and squad ids."""
+        if not np.any(self.squads.alive):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        self.squad_index.build(positions, teams, active_indices)
+        return self.squads.refresh(self.unit_data, active_indices, self.squad_index)
+
+    def step_squads(self, units, rows, squads, dt):
+        """Steer each intact squad as one agent at its centroid, then move its members into formation.
+
+        A squad moves no faster than its slowest member. Members only add
+        their separation to the formation steering.
+        """
+        live, first = np.unique(squads, return_index=True)
+        slowest = np.full(len(self.squads.alive), np.inf)
+        np.minimum.at(slowest, squads, units['max_speed'][rows])
+        _, squad_velocities = self.integrate(
+            self.squads.position[live], self.squads.velocity[live], units['team'][rows[first]],
+            slowest[live], np.zeros((len(live), 2)), dt
+        )
+        self.squads.velocity[live] = squad_velocities
+
+        indices = units['index'][rows]
+        total_weights = self.total_weights()
+        formation = self.squads.formation_forces(self.unit_data, indices, squads,
+                                                 self.squads.velocity, units['velocity'][rows])
+        separation = units.get('separation', np.zeros_like(units['position']))
+        forces = separation[rows] + formation * SQUAD_FORMATION_WEIGHT
+        positions, velocities = self.advance(units['position'][rows], units['velocity'][rows],
+                                             units['max_speed'][rows], forces / total_weights, dt)
+        self.unit_data.position[indices] = positions
+        self.unit_data.velocity[indices] = velocities
+
+    def shutdown(self):
+        """Stop any parallel workers."""
+        self.force_executor.shutdown()
+        if self.band_pool is not None:
+            self.band_pool.shutdown()
+            self.band_pool = None
+
+    def rebuild_flow_fields(self, blocked=None):
+        """Recompute the goal flow fields after the obstacles changed."""
+        for flow_field in self.flow_fields.values():
+            flow_field.rebuild(blocked)
+
+    def set_obstacles(self, obstacles):
+        """Use a new obstacle field and route the goal flow fields around it."""
+        self.obstacles = obstacles
+        for flow_field in self.flow_fields.values():
+            blocked = obstacles.blocked_nodes(flow_field.node_positions(), UNIT_RADIUS)
+            flow_field.rebuild(blocked if np.any(blocked) else None)
 
-    def compute_goal_forces(self, positions, teams, max_speeds):
-        """Compute goal forces for units moving towards objectives."""
-        desired_positions = np.where(teams[:, np.newaxis] == 1,
-                                     DESTINATION1, DESTINATION2)
-        desired = desired_positions - positions
-        distances = np.linalg.norm(desired, axis=1, keepdims=True)
-        with np.errstate(divide='ignore', invalid='ignore'):
-            desired = np.divide(desired, distances, where=distances != 0)
-            desired[~np.isfinite(desired)] = 0
-        goal_forces = desired * max_speeds[:, np.newaxis] - self.unit_data.velocity[teams]
+    def compute_goal_forces(self, positions, velocities, teams, max_speeds):
+        """Compute goal forces for units moving towards objectives by sampling their team's flow field."""
+        desired = np.zeros(positions.shape, dtype=np.float64)
+        for team, flow_field in self.flow_fields.items():
+            members = teams == team
+            desired[members] = flow_field.sample(positions[members])
+        goal_forces = desired * max_speeds[:, np.newaxis] - velocities
         return goal_forces * GOAL_WEIGHT
     
     def spawn_additional_units(self, original_unit_idx):
@@ -193,7 +394,8 @@ class UnitManager:
         # Calculate positions for additional units
         additional_positions = position + formation_radius * np.stack((np.cos(angles), np.sin(angles)), axis=1)
 
-        # Spawn additional units
+        # Spawn additional units; they march with the original unit as one squad
+        squad_members = [original_unit_idx]
         for pos in additional_positions:
             # Ensure additional units are within the game boundaries
             pos[0] = np.clip(pos[0], UNIT_RADIUS, WINDOW_WIDTH - UNIT_RADIUS)
@@ -214,3 +416,5 @@ class UnitManager:
                 color=color,
                 radius=radius
             )
+            squad_members.append(idx)
+        self.squads.form(self.unit_data, np.array(squad_members))